@@ -0,0 +1,161 @@
+""" batchGame.py
+~~~~~~~~~~~~~~~~
+Plays thousands of games of tic tac toe at once. Every board lives in a single
+NumPy int8 array of shape (N, 9) and each step applies one move to every game
+that is still going. This is the engine used to measure fitness, ``game.Game``
+is still the one to use for playing against a human.
+
+Boards use 1 for X, -1 for O and 0 for an open space. Move functions always
+get the boards from the point of view of the player whose turn it is (1 for
+themselves, -1 for the opponent), the same way ``NeuralnetPlayer`` sees them.
+
+"""
+
+import numpy as np
+
+from network import feedforward_stack, feedforward_indexed
+from perfectPlay import WIN_LINES, FIRST_SQUARE, LAST_SQUARE, board_keys, get_table
+
+X, O, EMPTY = 1, -1, 0
+
+
+### BatchGame - handles many games that are played in lock step
+class BatchGame(object):
+
+    def __init__(self, num_games):
+        self.boards = np.zeros((num_games, 9), dtype=np.int8)
+        self.active = np.ones(num_games, dtype=bool) # games that are not over yet
+        self.winners = np.zeros(num_games, dtype=np.int8) # X, O or EMPTY for cats games
+        self.current_player = X # X always starts
+        self.move_number = 0
+
+    def play_games(self, get_moves_x, get_moves_o):
+        """Play every game to the end.
+
+        Args:
+            get_moves_x (callable): takes an (N, 9) array of boards seen from
+                X's point of view and returns N moves (0-8). Only the moves for
+                games that are still active are used.
+            get_moves_o (callable): same as ``get_moves_x`` but for O.
+
+        Returns:
+            tuple: (X wins, O wins, ties) over all the games.
+        """
+        while self.active.any():
+            if self.current_player == X:
+                get_moves = get_moves_x
+            else:
+                get_moves = get_moves_o
+            self.make_moves(get_moves(self.boards * self.current_player))
+
+        return self.results()
+
+    def make_moves(self, moves):
+        """ Take current_player's turn in every active game.
+
+        Args:
+            moves (array of int): one move per game, 0-8. Moves for games that
+                are already over are ignored.
+
+        Raises:
+            ValueError: If any move points to a filled space
+        """
+        active = np.flatnonzero(self.active)
+        moves = np.asarray(moves)[active]
+        if (self.boards[active, moves] != EMPTY).any():
+            raise ValueError("move cannot point to a filled space")
+
+        self.boards[active, moves] = self.current_player
+        self.move_number += 1
+
+        # one reduction over the win lines of every active board tells us who just won
+        line_sums = self.boards[active][:, WIN_LINES].sum(axis=2)
+        won = (line_sums == 3 * self.current_player).any(axis=1)
+        self.winners[active[won]] = self.current_player
+        self.active[active[won]] = False
+        # all games are played in lock step so every board fills up at the same time
+        if self.move_number == 9:
+            self.active[:] = False
+
+        self.current_player = -self.current_player
+
+    def results(self, group_size=None):
+        """Return (X wins, O wins, ties) for the games played so far.
+
+        If ``group_size`` is given the games are split into consecutive
+        groups of that size and each count is an array with one entry per
+        group instead of a single total.
+        """
+        if group_size is None:
+            x_wins = int(np.count_nonzero(self.winners == X))
+            o_wins = int(np.count_nonzero(self.winners == O))
+            return x_wins, o_wins, len(self.winners) - x_wins - o_wins
+
+        winners = self.winners.reshape(-1, group_size)
+        x_wins = np.count_nonzero(winners == X, axis=1)
+        o_wins = np.count_nonzero(winners == O, axis=1)
+        return x_wins, o_wins, group_size - x_wins - o_wins
+
+
+#### Move functions
+def random_player_moves(boards, rng=None):
+    """The batched version of ``RandomPlayer``: win if possible, otherwise
+    block the opponent, otherwise pick an open square at random.
+
+    Like ``RandomPlayer`` this takes the first winning square and the last
+    blocking square on the board so the games come out the same. The win
+    and block squares are looked up in the ``perfectPlay`` table. ``rng``
+    is an ``np.random.Generator`` and one vector of random numbers covers
+    every board.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    n = len(boards)
+    open_squares = boards == EMPTY
+    table = get_table()[board_keys(boards)]
+    wins, blocks = table["x_wins"], table["o_wins"] # the player to move is X in their own view
+
+    # pick the k-th open square where k is uniform over the number of open squares
+    k = (rng.random(n) * open_squares.sum(axis=1)).astype(int)
+    moves = np.argmax(open_squares.cumsum(axis=1) > k[:, np.newaxis], axis=1)
+
+    moves = np.where(blocks != 0, LAST_SQUARE[blocks], moves)
+    return np.where(wins != 0, FIRST_SQUARE[wins], moves)
+
+
+def best_legal_moves(outputs, boards):
+    """Return the index of the highest output on each board that is an open
+    square, the same choice ``NeuralnetPlayer`` makes one game at a time."""
+    outputs = np.where(boards == EMPTY, outputs, -np.inf)
+    return np.argmax(outputs, axis=-1)
+
+
+def network_player_moves(network):
+    """Return a move function that asks ``network`` for every board at once"""
+    def get_moves(boards):
+        return best_legal_moves(network.feedforward(boards.T).T, boards)
+    return get_moves
+
+
+def population_player_moves(weights, games_per_network, activation="sigmoid"):
+    """Return a move function for a whole population of networks.
+
+    ``weights`` comes from ``network.stack_weights`` and the boards are
+    expected in consecutive groups of ``games_per_network``, one group per
+    stacked network. Every (network, board) pair is evaluated in one pass.
+    """
+    num_networks = len(weights[0])
+    def get_moves(boards):
+        a = boards.reshape(num_networks, games_per_network, 9).transpose(0, 2, 1)
+        outputs = feedforward_stack(weights, a, activation).transpose(0, 2, 1).reshape(boards.shape)
+        return best_legal_moves(outputs, boards)
+    return get_moves
+
+
+def indexed_player_moves(weights, index, activation="sigmoid"):
+    """Return a move function where board n is played by stacked network
+    ``index[n]``, for games between different members of a population.
+    ``weights`` comes from ``network.stack_weights``."""
+    def get_moves(boards):
+        return best_legal_moves(feedforward_indexed(weights, index, boards, activation), boards)
+    return get_moves
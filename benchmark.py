@@ -0,0 +1,178 @@
+""" benchmark.py
+~~~~~~~~~~~~~~~~
+Measures how fast the game, the network and the training loop are so changes
+can be compared. Every benchmark uses fixed seeds and the results are written
+as JSON, so two runs can simply be diffed.
+
+    $ python benchmark.py --output before.json
+    $ python benchmark.py --output after.json --quick
+
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from game import Game, RandomPlayer, PerfectPlayer, NeuralnetPlayer
+from network import Network, mutate_network
+from symmetry import MoveCache
+import geneticAlgorithm
+
+NET_SIZES = [9, 18, 12, 9]
+SEED = 1234
+
+
+def make_rng(*stream):
+    """Return the generator for one part of a benchmark, the same on every run and machine"""
+    return np.random.default_rng(np.random.SeedSequence(SEED, spawn_key=stream))
+
+
+def timed(func, repeat):
+    """Return the seconds it takes to call ``func`` ``repeat`` times"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return time.perf_counter() - start
+
+
+#### Benchmarks
+def bench_games(num_games):
+    """games/sec of ``Game.play_game`` for different pairs of players"""
+    net = Network(NET_SIZES, rng=make_rng(0))
+    pairs = {
+        "random_vs_random": (RandomPlayer, RandomPlayer),
+        "perfect_vs_random": (PerfectPlayer, RandomPlayer),
+        "neuralnet_vs_random": (lambda rng: NeuralnetPlayer(net), RandomPlayer),
+    }
+    results = {}
+    for name, (make_x, make_o) in sorted(pairs.items()):
+        # the same two players play every game
+        rng = make_rng(1)
+        x, o = make_x(rng), make_o(rng)
+        seconds = timed(lambda: Game(x, o).play_game(), num_games)
+        results[name] = {"games": num_games, "seconds": seconds, "games_per_sec": num_games / seconds}
+    return results
+
+
+def sample_positions(num_positions):
+    """Return ``num_positions`` (letter, game) pairs, the boards of random
+    games with ``letter`` to move, the same on every run"""
+    rng = make_rng(2)
+    positions = []
+    while len(positions) < num_positions:
+        game = Game(RandomPlayer(rng), RandomPlayer(rng))
+        game.playerX.player_letter, game.playerO.player_letter = "X", "O"
+        while not game.is_game_over and len(positions) < num_positions:
+            positions.append((game.current_player.player_letter, copy.copy(game)))
+            game.make_move(game.current_player.get_move(game))
+    return positions
+
+
+def bench_get_move(num_moves, num_positions=200):
+    """moves/sec of ``NeuralnetPlayer.get_move`` over ``num_positions``
+    positions from random games, without and with a ``MoveCache``"""
+    net = Network(NET_SIZES, rng=make_rng(0))
+    positions = sample_positions(num_positions)
+
+    def move_over_positions(player):
+        cycle = itertools.cycle(positions)
+
+        def move():
+            letter, game = next(cycle)
+            player.player_letter = letter
+            player.get_move(game)
+        return move
+
+    seconds = timed(move_over_positions(NeuralnetPlayer(net)), num_moves)
+    cached_seconds = timed(move_over_positions(NeuralnetPlayer(net, move_cache=MoveCache())), num_moves)
+    return {"moves": num_moves, "positions": num_positions, "seconds": seconds, "moves_per_sec": num_moves / seconds,
+            "cached_seconds": cached_seconds, "cached_moves_per_sec": num_moves / cached_seconds}
+
+
+def bench_feedforward(batch_sizes, repeat):
+    """seconds per ``Network.feedforward`` call for batches of boards"""
+    net = Network(NET_SIZES, rng=make_rng(0))
+    rng = make_rng(1)
+    results = {}
+    for batch_size in batch_sizes:
+        a = rng.integers(-1, 2, size=(9, batch_size)).astype(float)
+        seconds = timed(lambda: net.feedforward(a), repeat)
+        results[str(batch_size)] = {"calls": repeat, "seconds_per_call": seconds / repeat,
+                                    "boards_per_sec": batch_size * repeat / seconds}
+    return results
+
+
+def bench_mutate(num_children):
+    """children/sec of ``mutate_network``"""
+    net = Network(NET_SIZES, rng=make_rng(0))
+    rng = make_rng(1)
+    seconds = timed(lambda: mutate_network(net, rng), num_children)
+    return {"children": num_children, "seconds": seconds, "children_per_sec": num_children / seconds}
+
+
+def bench_generation(pop_sizes, generations):
+    """wall time of ``Population.advance_one_generation``"""
+    results = {}
+    cwd = os.getcwd()
+    for pop_size in pop_sizes:
+        pop = geneticAlgorithm.Population(pop_size, 0.1, NET_SIZES, seed=SEED)
+        times = []
+        stdout = sys.stdout
+        scratch = tempfile.mkdtemp(prefix="pytactoe-bench-")
+        try:
+            # the generation prints progress and saves itself, keep both out of the way
+            sys.stdout = open(os.devnull, "w")
+            os.chdir(scratch)
+            for _ in range(generations):
+                start = time.perf_counter()
+                pop.advance_one_generation()
+                times.append(time.perf_counter() - start)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            os.chdir(cwd)
+            shutil.rmtree(scratch)
+        results[str(pop_size)] = {"generations": generations, "seconds_per_generation": times,
+                                  "mean_seconds": sum(times) / len(times)}
+    return results
+
+
+def run(quick=False):
+    """Run every benchmark and return the results as a dict"""
+    scale = 10 if quick else 1
+    return {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__,
+                 "machine": platform.machine(), "seed": SEED, "quick": quick},
+        "play_game": bench_games(5000 // scale),
+        "get_move": bench_get_move(20000 // scale),
+        "feedforward": bench_feedforward([1, 10, 100, 1000], 2000 // scale),
+        "mutate_network": bench_mutate(20000 // scale),
+        "advance_one_generation": bench_generation([50, 200], 3 if not quick else 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pyTacToe")
+    parser.add_argument("-o", "--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--quick", action="store_true", help="run a tenth of the work for a fast check")
+    args = parser.parse_args(argv)
+
+    results = run(args.quick)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+""" breeding.py
+~~~~~~~~~~~~~~~
+Breeds a whole generation at once. The weights of every network are rows of
+one (pop_size, n_params) array (see ``network.flatten``) and selection,
+crossover and mutation are done with array operations on all the children
+together instead of one weight at a time.
+
+"""
+
+import numpy as np
+
+SELECTIONS = ("tournament", "rank")
+CROSSOVERS = (None, "uniform", "arithmetic")
+
+
+### Breeder
+class Breeder(object):
+
+    def __init__(self, mutation_rate=0.02, mutation_scale=None, crossover="uniform",
+                 selection="tournament", tournament_size=3):
+        """Settings for breeding a new generation.
+
+        Args:
+            mutation_rate (float 0-1): chance that each weight of a child mutates.
+            mutation_scale (Optional[float]): mutated weights get gaussian
+                noise with this standard deviation added. If None they are
+                replaced with a new random value, like ``mutate_network``.
+            crossover (Optional[str]): how two parents are combined, one of
+                ``CROSSOVERS``. None copies a single parent.
+            selection (str): how parents are picked, one of ``SELECTIONS``.
+            tournament_size (int): individuals compared in tournament selection.
+        """
+        if selection not in SELECTIONS:
+            raise ValueError("selection must be one of %s" % (SELECTIONS,))
+        if crossover not in CROSSOVERS:
+            raise ValueError("crossover must be one of %s" % (CROSSOVERS,))
+        self.mutation_rate = mutation_rate
+        self.mutation_scale = mutation_scale
+        self.crossover = crossover
+        self.selection = selection
+        self.tournament_size = tournament_size
+
+    def select(self, pop_size, num_parents, rng):
+        """Return the indexes of ``num_parents`` parents out of a population
+        that is sorted best first"""
+        if self.selection == "tournament":
+            # the best of a few random individuals is the one with the lowest index
+            return rng.integers(0, pop_size, size=(num_parents, self.tournament_size)).min(axis=1)
+        # rank selection, the best is picked pop_size times as often as the worst
+        ranks = np.arange(pop_size, 0, -1, dtype=float)
+        return rng.choice(pop_size, size=num_parents, p=ranks / ranks.sum())
+
+    def breed(self, genomes, num_children, rng):
+        """Return a (num_children, n_params) array of children.
+
+        Args:
+            genomes (np.ndarray): (pop_size, n_params) weights of the
+                current population, sorted best first.
+            num_children (int): how many children to make.
+            rng (np.random.Generator): source of randomness.
+        """
+        pop_size, n_params = genomes.shape
+        moms = genomes[self.select(pop_size, num_children, rng)]
+        if self.crossover is None:
+            children = moms
+        else:
+            dads = genomes[self.select(pop_size, num_children, rng)]
+            if self.crossover == "uniform":
+                children = np.where(rng.random((num_children, n_params)) < 0.5, moms, dads)
+            else:
+                mix = rng.random((num_children, 1))
+                children = mix * moms + (1 - mix) * dads
+
+        mutate = rng.random((num_children, n_params)) < self.mutation_rate
+        noise = rng.standard_normal(np.count_nonzero(mutate))
+        if self.mutation_scale is None:
+            children[mutate] = noise
+        else:
+            children[mutate] += self.mutation_scale * noise
+        return children.astype(genomes.dtype, copy=False)
@@ -0,0 +1,89 @@
+""" cache.py
+~~~~~~~~~~~~
+Remembers the fitness games of networks that have already played them.
+Survivors carry over to the next generation unchanged, so without a cache
+they replay every game each generation. Give a ``FitnessCache`` to
+``Population.fitness_cache`` and a network whose weights were seen before
+takes its wins, losses and ties from the cache, so only the new children
+play:
+
+    pop.fitness_cache = FitnessCache(capacity=10000)
+
+Entries are keyed by a hash of the network's weights and biases (plus the
+evaluation settings), so a network that changes, for example by gradient
+training, is a new entry. The least recently used entries are dropped once
+there are ``capacity`` of them.
+
+Against stochastic opponents a cached result is one fixed sample of games.
+With ``accumulate`` cached networks play again and their new games are
+added to the old ones, so the longer a network survives the better its
+fitness is known. That plays as many games as no cache at all, and the
+pool is then sorted by fitness per game.
+
+The adaptive evaluation does not use the cache, there how many games a
+network plays depends on the rest of the pool. A checkpoint does not save
+the cache, so a resumed run starts with an empty one.
+
+"""
+
+import hashlib
+from collections import OrderedDict
+
+from network import flatten
+
+
+### FitnessCache
+class FitnessCache(object):
+
+    def __init__(self, capacity=10000, accumulate=False):
+        """
+        Args:
+            capacity (int): networks remembered, the least recently used are
+                dropped first.
+            accumulate (bool): play cached networks again and add the new
+                games to the cached ones instead of skipping them.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.accumulate = accumulate
+        self.entries = OrderedDict() # key -> (wins, losses, ties)
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key(net, context=()):
+        """Return the key of ``net`` for games played under ``context``, a
+        hash of its shape, activation, weights and biases"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((tuple(net.sizes), net.activation, tuple(context))).encode("utf-8"))
+        h.update(flatten(net, net.weights[0].dtype).tobytes())
+        return h.digest()
+
+    def get(self, key):
+        """Return the cached (wins, losses, ties) for ``key`` or None"""
+        results = self.entries.get(key)
+        if results is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return results
+
+    def put(self, key, results):
+        self.entries[key] = tuple(int(r) for r in results)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        """Return the lookups since the cache was made and its size"""
+        lookups = self.hits + self.misses
+        return {"cache_hits": self.hits, "cache_misses": self.misses, "cache_evictions": self.evictions,
+                "cache_hit_rate": self.hits / lookups if lookups else 0.0, "cache_size": len(self.entries)}
@@ -0,0 +1,122 @@
+""" checkpoint.py
+~~~~~~~~~~~~~~~~~
+A population checkpoint is a directory that never needs to be rewritten in
+full:
+
+    meta.json           small header with the settings, the stats of every
+                        individual and the size of everything below
+    weights-<gen>.npy   the weights of every network as one contiguous
+                        (pop_size, n_params) array in the networks' own
+                        dtype (float64 unless chosen otherwise, older
+                        checkpoints are float32) that can be memory-mapped
+    history.bin         one float32 row of weights per history entry,
+                        only ever appended to
+    history.jsonl       the stats for each row of history.bin, one JSON
+                        object per line, only ever appended to
+
+meta.json is written last (to a temp file which is then renamed), so it is the
+commit point: anything a crash left behind past the sizes it records is
+ignored and cut off by the next save.
+
+"""
+
+import json
+import os
+
+import numpy as np
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+HISTORY_WEIGHTS_FILE = "history.bin"
+HISTORY_STATS_FILE = "history.jsonl"
+
+
+def is_checkpoint(path):
+    """Return True if ``path`` is a checkpoint directory"""
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def read_meta(path):
+    with open(os.path.join(path, META_FILE), "r") as f:
+        return json.load(f)
+
+
+def write_checkpoint(path, meta, weights, history_weights, history_stats, append_history=True):
+    """Save a checkpoint into the directory ``path``.
+
+    Args:
+        path (str): checkpoint directory, created if needed.
+        meta (dict): JSON-able header, must contain "generation".
+        weights (np.ndarray): (pop_size, n_params) array, saved in its own
+            dtype so networks come back exactly as they were.
+        history_weights (np.ndarray): (n, n_params) float32 rows to append
+            to the history.
+        history_stats (List[dict]): n JSON-able records to go with them.
+        append_history (bool): False starts the history files again with
+            only these records, for a checkpoint of a different run.
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    old_meta = read_meta(path) if is_checkpoint(path) else {}
+    if not append_history:
+        old_meta = dict(old_meta, history_weights_bytes=0, history_stats_bytes=0, history_count=0)
+
+    weights_file = "weights-%i.npy" % meta["generation"]
+    tmp = os.path.join(path, weights_file + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, np.ascontiguousarray(weights))
+    os.replace(tmp, os.path.join(path, weights_file))
+
+    # append the new history, dropping anything an interrupted save left past the committed end
+    weights_bytes = _append(os.path.join(path, HISTORY_WEIGHTS_FILE), old_meta.get("history_weights_bytes", 0),
+                            np.ascontiguousarray(history_weights, dtype=np.float32).tobytes())
+    stats_bytes = _append(os.path.join(path, HISTORY_STATS_FILE), old_meta.get("history_stats_bytes", 0),
+                          "".join(json.dumps(s) + "\n" for s in history_stats).encode("utf-8"))
+
+    meta = dict(meta, version=FORMAT_VERSION, weights_file=weights_file,
+                history_count=old_meta.get("history_count", 0) + len(history_stats),
+                history_weights_bytes=weights_bytes, history_stats_bytes=stats_bytes)
+    tmp = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+    old_weights_file = old_meta.get("weights_file")
+    if old_weights_file and old_weights_file != weights_file:
+        try:
+            os.remove(os.path.join(path, old_weights_file))
+        except OSError:
+            pass # still memory-mapped somewhere (windows), it gets replaced next time
+
+
+def _append(filename, committed_bytes, data):
+    """Append ``data`` after the first ``committed_bytes`` of ``filename``
+    and return the new committed size"""
+    with open(filename, "ab") as f:
+        f.truncate(committed_bytes)
+        f.write(data)
+    return committed_bytes + len(data)
+
+
+def read_checkpoint(path, mmap=True):
+    """Return (meta, weights) of the checkpoint in ``path``. The weights are
+    memory-mapped read-only unless ``mmap`` is False."""
+    meta = read_meta(path)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError("unsupported checkpoint version %r" % meta.get("version"))
+    weights = np.load(os.path.join(path, meta["weights_file"]), mmap_mode="r" if mmap else None)
+    return meta, weights
+
+
+def read_history(path):
+    """Return (weights, stats) of every history entry in the checkpoint. The
+    weights are a memory-mapped (n, n_params) float32 array."""
+    meta = read_meta(path)
+    count = meta["history_count"]
+    if count == 0:
+        return np.zeros((0, meta["n_params"]), dtype=np.float32), []
+    weights = np.memmap(os.path.join(path, HISTORY_WEIGHTS_FILE), dtype=np.float32, mode="r",
+                        shape=(count, meta["n_params"]))
+    with open(os.path.join(path, HISTORY_STATS_FILE), "rb") as f:
+        stats = [json.loads(line) for line in f.read(meta["history_stats_bytes"]).decode("utf-8").splitlines()]
+    return weights, stats
@@ -0,0 +1,151 @@
+""" client.py
+~~~~~~~~~~~~~
+Plays on a ``server.py`` server. By default a person plays in the terminal,
+with ``simulate`` many sessions play random moves at the same time, which is
+an easy way to load the server and watch its bot moves get batched:
+
+    $ python pyTacToe.py connect
+    $ python pyTacToe.py connect --simulate 500 --games 20
+
+"""
+
+import asyncio
+import time
+
+import numpy as np
+
+
+def print_board(board):
+    """Print a BOARD line's squares the way ``Game.display_game_board`` does"""
+    b = [str(i + 1) if s == "." else s for i, s in enumerate(board)]
+    print("")
+    print("  %s | %s | %s" % (b[0], b[1], b[2]))
+    print(" ---+---+---")
+    print("  %s | %s | %s" % (b[3], b[4], b[5]))
+    print(" ---+---+---")
+    print("  %s | %s | %s" % (b[6], b[7], b[8]))
+
+
+### Connection - one session with the server
+class Connection(object):
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.bots = []
+
+    @classmethod
+    async def open(cls, host="127.0.0.1", port=8765):
+        connection = cls(*(await asyncio.open_connection(host, port)))
+        hello = await connection.read()
+        connection.bots = hello[2:]
+        return connection
+
+    async def read(self):
+        """Return the words of the next line from the server"""
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("the server closed the connection")
+        return line.decode().split()
+
+    async def send(self, line):
+        self.writer.write((line + "\n").encode())
+        await self.writer.drain()
+
+    async def updates(self):
+        """Read lines up to and including the next TURN, OVER or ERR and
+        return them as a dict of command -> arguments"""
+        updates = {}
+        while True:
+            words = await self.read()
+            updates[words[0]] = words[1:]
+            if words[0] in ("TURN", "OVER", "ERR"):
+                return updates
+
+    async def close(self):
+        await self.send("QUIT")
+        self.writer.close()
+
+
+async def play_game(connection, letter, bot=None, choose_move=None):
+    """Play one game and return the winner ("X", "O" or "TIE").
+
+    ``choose_move`` gets the board (a string of X, O and .) and returns a
+    square 1-9, if it is None a person is asked.
+    """
+    await connection.send("NEW %s %s" % (letter, bot or ""))
+    started = False
+    while True:
+        updates = await connection.updates()
+        if "ERR" in updates:
+            # only a person gets to try a move again
+            if not started or choose_move is not None:
+                raise ValueError(" ".join(updates["ERR"]))
+            print(" ".join(updates["ERR"]))
+        started = True
+        board = updates.get("BOARD", [None])[0]
+        if choose_move is None:
+            if "BOT" in updates:
+                print("The bot took %s" % updates["BOT"][0])
+            if board is not None:
+                print_board(board)
+        if "OVER" in updates:
+            return updates["OVER"][0]
+
+        if choose_move is None:
+            move = await asyncio.get_running_loop().run_in_executor(None, input, "Choose your spot: ")
+        else:
+            move = choose_move(board)
+        await connection.send("MOVE %s" % move)
+
+
+async def play_interactive(host, port, letter="X", bot=None):
+    connection = await Connection.open(host, port)
+    print("Connected, bots: %s" % " ".join(connection.bots))
+    try:
+        while True:
+            winner = await play_game(connection, letter, bot)
+            print("Cats game." if winner == "TIE" else "%s wins." % winner)
+            again = await asyncio.get_running_loop().run_in_executor(None, input, "Play again? ")
+            if not again.lower().startswith("y"):
+                break
+    finally:
+        await connection.close()
+
+
+async def simulate(host, port, sessions=100, games=10, bot=None, seed=None):
+    """Play ``games`` games in each of ``sessions`` sessions at once with
+    random moves. Returns the results and the server's STATS line."""
+    rng = np.random.default_rng(seed)
+    results = {"X": 0, "O": 0, "TIE": 0}
+
+    def random_move(board):
+        squares = [i + 1 for i, s in enumerate(board) if s == "."]
+        return squares[rng.integers(len(squares))]
+
+    async def session(number):
+        connection = await Connection.open(host, port)
+        try:
+            for game in range(games):
+                letter = "X" if (number + game) % 2 == 0 else "O"
+                results[await play_game(connection, letter, bot, random_move)] += 1
+        finally:
+            await connection.close()
+
+    await asyncio.gather(*[session(n) for n in range(sessions)])
+    connection = await Connection.open(host, port)
+    await connection.send("STATS")
+    stats = " ".join((await connection.read())[1:])
+    await connection.close()
+    return results, stats
+
+
+def main(host="127.0.0.1", port=8765, letter="X", bot=None, sessions=0, games=10, seed=None):
+    if not sessions:
+        asyncio.run(play_interactive(host, port, letter, bot))
+        return
+    start = time.time()
+    results, stats = asyncio.run(simulate(host, port, sessions, games, bot, seed))
+    print("[%i games in %.2f seconds: X %i, O %i, ties %i]"
+          % (sessions * games, time.time() - start, results["X"], results["O"], results["TIE"]))
+    print("[server %s]" % stats)
@@ -0,0 +1,77 @@
+""" exhaustive.py
+~~~~~~~~~~~~~~~~~
+Scores networks against every possible opponent instead of a sample of random
+games. The network's own moves are fixed, so the game tree it can end up in is
+small: a few hundred lines as X and at most 945 as O. The tree is walked one
+ply at a time for a whole population at once, and positions that are reached
+by more than one line are merged by board key (keeping count of how many
+lines reach them) so each shared subtree is only expanded once.
+
+The results are exact counts of the opponent lines that end in a win, loss or
+tie for the network, so the same network always gets the same fitness.
+
+"""
+
+import numpy as np
+
+from batchGame import X, O, EMPTY, best_legal_moves
+from network import feedforward_indexed, stack_weights
+from perfectPlay import WIN_LINES, NUM_KEYS, board_keys
+
+
+def evaluate_exhaustive(weights, activation="sigmoid"):
+    """Walk the game tree of every stacked network as X and as O.
+
+    Args:
+        weights (List[np.ndarray]): from ``network.stack_weights``.
+        activation (str): activation of the networks.
+
+    Returns:
+        tuple: arrays of (wins, losses, ties), one entry per network, each
+        the number of opponent lines that end that way.
+    """
+    num_networks = len(weights[0])
+    wins = np.zeros(num_networks, dtype=np.int64)
+    losses = np.zeros(num_networks, dtype=np.int64)
+    ties = np.zeros(num_networks, dtype=np.int64)
+
+    for network_letter in (X, O):
+        boards = np.zeros((num_networks, 9), dtype=np.int8)
+        owner = np.arange(num_networks) # which network each position belongs to
+        lines = np.ones(num_networks, dtype=np.int64) # how many lines reach each position
+        player = X
+        while len(boards):
+            if player == network_letter:
+                # the network's move is fixed, one child per position
+                outputs = feedforward_indexed(weights, owner, boards * player, activation)
+                rows, moves = np.arange(len(boards)), best_legal_moves(outputs, boards)
+            else:
+                # every reply of the opponent
+                rows, moves = np.nonzero(boards == EMPTY)
+            boards, owner, lines = boards[rows], owner[rows], lines[rows]
+            boards[np.arange(len(boards)), moves] = player
+
+            won = (boards[:, WIN_LINES].sum(axis=2) == 3 * player).any(axis=1)
+            full = ~won & (boards != EMPTY).all(axis=1)
+            won_lines = np.bincount(owner[won], lines[won], minlength=num_networks).astype(np.int64)
+            if player == network_letter:
+                wins += won_lines
+            else:
+                losses += won_lines
+            ties += np.bincount(owner[full], lines[full], minlength=num_networks).astype(np.int64)
+
+            # merge the positions that more than one line leads to
+            going = ~(won | full)
+            keys = owner[going] * NUM_KEYS + board_keys(boards[going])
+            keys, first, merged = np.unique(keys, return_index=True, return_inverse=True)
+            lines = np.bincount(merged.ravel(), lines[going]).astype(np.int64)
+            boards, owner = boards[going][first], owner[going][first]
+            player = -player
+
+    return wins, losses, ties
+
+
+def evaluate_network(net):
+    """Return (wins, losses, ties) line counts for a single ``Network``"""
+    wins, losses, ties = evaluate_exhaustive(stack_weights([net]), net.activation)
+    return int(wins[0]), int(losses[0]), int(ties[0])
@@ -1,21 +1,150 @@
 import os
-from random import randint
+
+import numpy as np
+
+import perfectPlay
 
 def clear_screen():
     """ http://stackoverflow.com/questions/517970/how-to-clear-python-interpreter-console """
     os.system(['clear','cls'][os.name == 'nt'])
 
+# directions a line can run in as (rows, columns) steps: across, down and both diagonals
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+### Layout - the shape of a board, shared by every game played on it
+class Layout(object):
+    """A ``width`` x ``height`` board where ``k`` in a row wins. Square i is
+    at row i // width and column i % width, counting from the top left.
+
+    Every line of k squares is a bitmask, and ``lines_through[i]`` holds the
+    ones that pass through square i. Only a line through the last move can
+    have just been completed, so checking for a win looks at no more than
+    4 * k lines whatever the size of the board. With ``gravity`` a piece can
+    only go on the bottom row or on top of another piece, like connect four.
+    Use ``get_layout`` so the index is only built once for each shape.
+    """
+    __slots__ = ("width", "height", "k", "gravity", "size", "full", "lines", "lines_through")
+
+    def __init__(self, width=3, height=3, k=3, gravity=False):
+        if width < 1 or height < 1:
+            raise ValueError("the board must be at least 1x1")
+        if not 1 <= k <= max(width, height):
+            raise ValueError("k must be between 1 and the longest side of the board")
+        self.width, self.height, self.k, self.gravity = width, height, k, gravity
+        self.size = width * height
+        self.full = (1 << self.size) - 1
+
+        lines = []
+        for row in range(height):
+            for col in range(width):
+                for down, across in DIRECTIONS:
+                    end_row, end_col = row + down * (k - 1), col + across * (k - 1)
+                    if 0 <= end_row < height and 0 <= end_col < width:
+                        mask = 0
+                        for step in range(k):
+                            mask |= 1 << ((row + down * step) * width + col + across * step)
+                        if mask not in lines: # with k = 1 every direction is the same line
+                            lines.append(mask)
+        self.lines = tuple(lines)
+        self.lines_through = tuple(tuple(m for m in lines if m >> i & 1) for i in range(self.size))
+
+    def is_open(self, taken, move):
+        """True if a piece can go on square ``move`` when ``taken`` are filled"""
+        if taken >> move & 1:
+            return False
+        below = move + self.width
+        return not self.gravity or below >= self.size or bool(taken >> below & 1)
+
+    def open_squares(self, taken):
+        """Return the squares a piece can go on, lowest first"""
+        return [i for i in range(self.size) if self.is_open(taken, i)]
+
+    def completes_line(self, bits, move):
+        """True if square ``move`` is part of a full line in ``bits``"""
+        for mask in self.lines_through[move]:
+            if bits & mask == mask:
+                return True
+        return False
+
+    def winning_squares(self, bits, taken):
+        """Return the open squares that would complete a line for ``bits``"""
+        return [i for i in self.open_squares(taken) if self.completes_line(bits | 1 << i, i)]
+
+
+_LAYOUTS = {}
+
+def get_layout(width=3, height=3, k=3, gravity=False):
+    """Return the shared ``Layout`` for a board shape"""
+    shape = (width, height, k, bool(gravity))
+    layout = _LAYOUTS.get(shape)
+    if layout is None:
+        layout = _LAYOUTS[shape] = Layout(*shape)
+    return layout
+
+# the classic board, the only one perfectPlay and symmetry know about
+CLASSIC = get_layout()
+# each way to win on it as a bitmask of board squares (square i is bit i)
+WIN_MASKS = CLASSIC.lines
+# the classic board is small enough to look everything up: WINNING[bits] is
+# True if the squares in ``bits`` contain a line, OPEN_SQUARES[taken] are the
+# squares that are not in ``taken``
+WINNING = tuple(any(bits & m == m for m in WIN_MASKS) for bits in range(512))
+OPEN_SQUARES = tuple(tuple(i for i in range(9) if not taken >> i & 1) for taken in range(512))
+# the same for NumPy: SQUARE_BITS[bits] is ``bits`` as an array with a 1 for
+# each of its squares and OPEN_SQUARE_ARRAYS[taken] the open squares as an array
+SQUARE_BITS = ((np.arange(512)[:, None] >> np.arange(9)) & 1).astype(np.int8)
+OPEN_SQUARE_ARRAYS = tuple(np.array(squares, dtype=np.intp) for squares in OPEN_SQUARES)
+
 ### Game - handles game related info and mechanics
 class Game(object):
-
-    def __init__(self, playerX, playerO):
+    """The board is kept as two bitboards, one int for each player with bit i
+    for square i. On the classic board wins and open squares are looked up
+    in tables of every bitboard, on other boards only the lines through the
+    last move are checked for a win. ``board`` gives the familiar list view.
+
+    By default it is tic tac toe, pass ``width``, ``height`` and ``k`` for
+    other m,n,k games (4x4 with 4 in a row, ...) and ``gravity=True`` for
+    connect four style games (7 wide, 6 high, k = 4).
+    """
+    __slots__ = ("playerX", "playerO", "current_player", "x_bits", "o_bits",
+                 "is_game_over", "winner", "move_number", "layout", "last_move")
+
+    def __init__(self, playerX, playerO, width=3, height=3, k=3, gravity=False):
         self.playerX = playerX
         self.current_player = playerX # X always starts
         self.playerO = playerO
-        self.board = ["", "", "", "", "", "", "", "", ""]
+        self.layout = get_layout(width, height, k, gravity)
+        self.x_bits, self.o_bits = 0, 0
         self.is_game_over = False
         self.winner = None # nobody yet
         self.move_number = 0
+        self.last_move = None
+
+    @property
+    def size(self):
+        """The number of squares on the board"""
+        return self.layout.size
+
+    @property
+    def board(self):
+        """The board as a list of "X", "O" and "" (for open spaces)"""
+        x, o = self.x_bits, self.o_bits
+        return ["X" if x >> i & 1 else ("O" if o >> i & 1 else "") for i in range(self.layout.size)]
+
+    def masks(self, letter):
+        """Return the bitboards of ``letter`` and of their opponent"""
+        if letter == "X":
+            return self.x_bits, self.o_bits
+        return self.o_bits, self.x_bits
+
+    def open_squares(self):
+        """Return the squares the current player can move on"""
+        if self.layout is CLASSIC:
+            return OPEN_SQUARES[self.x_bits | self.o_bits]
+        return self.layout.open_squares(self.x_bits | self.o_bits)
+
+    def is_open(self, move):
+        return self.layout.is_open(self.x_bits | self.o_bits, move)
 
     def play_game(self):
         self.playerX.player_letter = "X"
@@ -36,26 +165,34 @@ class Game(object):
         """ Take current_player's turn by choosing a move.
 
         Args:
-            move (int): index of the move on the board, 0-8
+            move (int): index of the move on the board, 0 to size - 1
 
         Raises:
             TypeError: If move is not of type int
             IndexError: If move is out of bounds for the board
-            ValueError: If the move is not valid (not on board or space is taken)
+            ValueError: If the move is not valid (space is taken or, with
+                gravity, there is nothing under it)
         """
-        # make sure move is valid (int, 0-8, and space is open)
+        # make sure move is valid (int, on the board, and space is open)
         if type(move) is not int:
             raise TypeError("move must be an int")
 
-        if move < 0 or move > 8:
-            raise IndexError("move must be 0-8")
+        if move < 0 or move >= self.layout.size:
+            raise IndexError("move must be 0-%i" % (self.layout.size - 1))
 
-        if self.board[move] != "":
+        taken = self.x_bits | self.o_bits
+        if taken >> move & 1:
             raise ValueError("move cannot point to a filled space")
+        if self.layout.gravity and not self.layout.is_open(taken, move):
+            raise ValueError("move must be on the bottom row or on top of another piece")
 
         # update the board
-        self.board[move] = self.current_player.player_letter
+        if self.current_player == self.playerX:
+            self.x_bits |= 1 << move
+        else:
+            self.o_bits |= 1 << move
         self.move_number += 1
+        self.last_move = move
 
         # check if player just won, or if it was a cats game
         if self.did_player_win():
@@ -71,56 +208,76 @@ class Game(object):
             self.current_player = self.playerX
 
     def did_player_win(self):
-        """ Check if the current_player has won.
+        """ Check if the current_player has won with their last move.
         Returns:
             bool: True if the current_player has won and False otherwise.
         """
-        b = self.board
-        p = self.current_player.player_letter
-        # brute force check all possible combos
-        return ((b[0] == p and b[1] == p and b[2] == p) or # across the top
-        (b[3] == p and b[4] == p and b[5] == p) or # across the middle
-        (b[6] == p and b[7] == p and b[8] == p) or # across the bottom
-        (b[0] == p and b[3] == p and b[6] == p) or # down the left side
-        (b[1] == p and b[4] == p and b[7] == p) or # down the middle
-        (b[2] == p and b[5] == p and b[8] == p) or # down the right side
-        (b[0] == p and b[4] == p and b[8] == p) or # diagonal
-        (b[2] == p and b[4] == p and b[6] == p)) # diagonal
+        bits = self.x_bits if self.current_player == self.playerX else self.o_bits
+        if self.layout is CLASSIC:
+            return WINNING[bits]
+        if self.last_move is None:
+            return False
+        return self.layout.completes_line(bits, self.last_move)
 
     def is_board_full(self):
         """ Check if the board is full.
         Returns:
             bool: True if the board is full (AKA cats game) and False otherwise.
         """
-        for i in self.board:
-            if i == "":
-                return False
-
-        return True
+        return (self.x_bits | self.o_bits) == self.layout.full
 
     def display_game_board(self):
         """ print the game board to the console in human readable form """
+        layout = self.layout
+        cell = len(str(layout.size))
+        open_squares = set() if self.is_game_over else set(self.open_squares())
 
-        # insert the space number in empty spaces so making moves is easy
+        # insert the space number in open spaces so making moves is easy
         b = []
         for i, v in enumerate(self.board):
             if v == "":
-                if not self.is_game_over:
-                    b.append(str(i + 1))
+                if i in open_squares:
+                    b.append(str(i + 1).rjust(cell))
                 else:
-                    b.append(" ") # keep the spacing when we dont displat number helpers
+                    b.append(" " * cell) # keep the spacing when we dont displat number helpers
             else:
-                b.append(v)
+                b.append(v.rjust(cell))
 
-        clear_screen()
-        print("  %s | %s | %s" % (b[0], b[1], b[2]))
-        print(" ---+---+---    Move # %i" % self.move_number)
-        print("  %s | %s | %s" % (b[3], b[4], b[5]))
+        notes = ["    Move # %i" % self.move_number]
         if not self.is_game_over:
-            print(" ---+---+---    %s's turn" % self.current_player.player_letter)
-        else:
-            print(" ---+---+---")
-        print("  %s | %s | %s" % (b[6], b[7], b[8]))
+            notes.append("    %s's turn" % self.current_player.player_letter)
+        divider = " " + "+".join(["-" * (cell + 2)] * layout.width)
+
+        clear_screen()
+        for row in range(layout.height):
+            if row:
+                print(divider + (notes.pop(0) if notes else ""))
+            print("  " + " | ".join(b[row * layout.width:(row + 1) * layout.width]))
+        for note in notes:
+            print(note)
+
+
+### RandomStream - cheap random picks for players that make one move at a time
+class RandomStream(object):
+    """Uniform numbers from an ``np.random.Generator`` (a new unseeded one if
+    ``rng`` is None), drawn ``block_size`` at a time so that a move does not
+    cost a call into the generator"""
+    __slots__ = ("rng", "block_size", "values", "index")
+
+    def __init__(self, rng=None, block_size=256):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.block_size = block_size
+        self.values = []
+        self.index = 0
+
+    def choice(self, seq):
+        """Return an item of ``seq`` picked uniformly at random"""
+        if self.index == len(self.values):
+            self.values = self.rng.random(self.block_size).tolist()
+            self.index = 0
+        u = self.values[self.index]
+        self.index += 1
+        return seq[int(u * len(seq))]
 
 
 ### Player and subclasses - handles game time decisions and record keeping
@@ -128,7 +285,7 @@ class Player(object):
     """A player in a Game of tic tac toe"""
 
     def get_move(self, game):
-        """Return an int 0-8 representing a valid move on the game board"""
+        """Return an int 0 to game.size - 1 representing a valid move on the game board"""
         raise NotImplementedError("Subclasses should implement this!")
 
     def game_over_callback(self, game):
@@ -148,13 +305,15 @@ class HumanPlayer(Player):
             try:
                 move = int(move) - 1 # shift down to zero based
             except ValueError:
-                print("You must enter an integer, 1-9.")
+                print("You must enter an integer, 1-%i." % game.size)
                 continue
 
-            if move < 0 or move > 8:
+            if move < 0 or move >= game.size:
                 print("That move is not even on the board.")
             elif game.board[move] != "":
                 print("That spot is already taken.")
+            elif not game.is_open(move):
+                print("That spot has nothing under it.")
             else:
                 break
 
@@ -204,83 +363,102 @@ class HumanPlayer(Player):
 
 
 class RandomPlayer(Player):
-    """A type of player that will make moves at random unless it means a win or loss"""
+    """A type of player that will make moves at random unless it means a win or loss
+
+    ``rng`` is an ``np.random.Generator``, seed it to get the same games again.
+    """
+    def __init__(self, rng=None):
+        self.random = RandomStream(rng)
+
     def get_move(self, game):
-        open_move_index = []
-        must_block_index = ""
-        for i, val in enumerate(game.board):
-            if val == "":
-                open_move_index.append(i) # Make a list of all possible moves
-
-                # check if move would win (if so take it)
-                b = list(game.board) # make a copy of the board so we can check it out
-                p = self.player_letter
-                b[i] = p # pretend that we made this move
-                if ((b[0] == p and b[1] == p and b[2] == p) or # across the top
-                    (b[3] == p and b[4] == p and b[5] == p) or # across the middle
-                    (b[6] == p and b[7] == p and b[8] == p) or # across the bottom
-                    (b[0] == p and b[3] == p and b[6] == p) or # down the left side
-                    (b[1] == p and b[4] == p and b[7] == p) or # down the middle
-                    (b[2] == p and b[5] == p and b[8] == p) or # down the right side
-                    (b[0] == p and b[4] == p and b[8] == p) or # diagonal
-                    (b[2] == p and b[4] == p and b[6] == p)): # diagonal
-                    return i
-
-                # check if opponent would win (block, unless u can win)
-                # flip who we are checking
-                if p == "X":
-                    p = "O"
-                else:
-                    p = "X"
-                b[i] = p # pretend that the opponent made this move
-                if ((b[0] == p and b[1] == p and b[2] == p) or # across the top
-                    (b[3] == p and b[4] == p and b[5] == p) or # across the middle
-                    (b[6] == p and b[7] == p and b[8] == p) or # across the bottom
-                    (b[0] == p and b[3] == p and b[6] == p) or # down the left side
-                    (b[1] == p and b[4] == p and b[7] == p) or # down the middle
-                    (b[2] == p and b[5] == p and b[8] == p) or # down the right side
-                    (b[0] == p and b[4] == p and b[8] == p) or # diagonal
-                    (b[2] == p and b[4] == p and b[6] == p)): # diagonal
-                    must_block_index = i
-                b[i] = "" # set it back to open
-
-        if must_block_index != "":
-            return must_block_index
+        if game.layout is CLASSIC:
+            # the winning squares of every tic tac toe board are in the perfectPlay table
+            key = perfectPlay.bits_key(game.x_bits, game.o_bits)
+            # take the first square that wins
+            wins = perfectPlay.winning_squares(key, self.player_letter)
+            if wins:
+                return (wins & -wins).bit_length() - 1
+
+            # block the last square the opponent would win on
+            blocks = perfectPlay.winning_squares(key, "O" if self.player_letter == "X" else "X")
+            if blocks:
+                return blocks.bit_length() - 1
+        else:
+            own, opponent = game.masks(self.player_letter)
+            taken = own | opponent
+            wins = game.layout.winning_squares(own, taken)
+            if wins:
+                return wins[0]
+
+            blocks = game.layout.winning_squares(opponent, taken)
+            if blocks:
+                return blocks[-1]
 
         # randomly pick one of the possible valid moves
-        move = open_move_index[randint(0,len(open_move_index) - 1)]
-        return move
+        return self.random.choice(game.open_squares())
+
+
+class PerfectPlayer(Player):
+    """A type of player that never loses, picking at random between the perfect moves"""
+    def __init__(self, rng=None):
+        self.random = RandomStream(rng)
+
+    def get_move(self, game):
+        if game.layout is not CLASSIC:
+            raise ValueError("the perfect player only knows 3x3 tic tac toe")
+        moves = perfectPlay.best_moves(perfectPlay.bits_key(game.x_bits, game.o_bits))
+        return self.random.choice(moves)
 
 
 class NeuralnetPlayer(Player):
-    """A type of player that will make moves that a neural network chooses"""
-    def __init__(self, network, individual=None):
+    """A type of player that will make moves that a neural network chooses
+
+    If a ``symmetry.MoveCache`` is given the move the network picks on each
+    board is remembered, so the same board after that is answered without
+    running the network. The cache is keyed on the exact board, not its
+    canonical version: a network does not answer symmetric boards
+    symmetrically, and the cached player has to make the moves its fitness
+    was measured with. The cache is only used for tic tac toe, other boards
+    always ask the network.
+    The network needs one input (and output) for each square of the board.
+    """
+    def __init__(self, network, individual=None, move_cache=None):
         self.network = network
         self.individual = individual
+        self.move_cache = move_cache
 
     def get_move(self, game):
-        # adjust the game board so that 1 represent this player,
-        # 0 for blanks, and -1 for the opponent
-        a = []
-        for i in game.board:
-            if i == self.player_letter:
-                a.append(1)
-            elif i == "":
-                a.append(0)
-            else:
-                a.append(-1)
-        # ask the network what it wants to do
-        o = self.network.feedforward(a)
-        # find best valid move
-        max_val = -1000
-        move = 0
-        for i, val in enumerate(o):
-            if val > max_val and a[i] == 0:
-                max_val = val
-                move = i
-
+        if self.network.sizes[0] != game.size:
+            raise ValueError("a %i square board needs a network with %i inputs, not %i"
+                             % (game.size, game.size, self.network.sizes[0]))
+        own, opponent = game.masks(self.player_letter)
+        if self.move_cache is not None and game.layout is CLASSIC:
+            return self.get_cached_move(own, opponent)
+        return self.best_move(own, opponent, game.layout)
+
+    def get_cached_move(self, own, opponent):
+        key = own | opponent << 9
+        move = self.move_cache.get(key)
+        if move is None:
+            move = self.best_move(own, opponent)
+            self.move_cache.put(key, move)
         return move
 
+    def best_move(self, own, opponent, layout=CLASSIC):
+        """Return the open square the network likes best when this player
+        has the squares of the bitboard ``own`` and the opponent those of
+        ``opponent``"""
+        # the network sees 1 for this player, 0 for blanks and -1 for the opponent
+        if layout is CLASSIC:
+            a = SQUARE_BITS[own] - SQUARE_BITS[opponent]
+            open_squares = OPEN_SQUARE_ARRAYS[own | opponent]
+        else:
+            a = [(own >> i & 1) - (opponent >> i & 1) for i in range(layout.size)]
+            open_squares = np.array(layout.open_squares(own | opponent), dtype=np.intp)
+        # the first best output on an open square, like batchGame.best_legal_moves
+        o = self.network.feedforward(a)
+        return int(open_squares[o[open_squares].argmax()])
+
     def game_over_callback(self, game):
         if self.individual is not None:
             # incriment the individuals stats
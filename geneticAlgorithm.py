@@ -8,31 +8,162 @@ to them as a training mechanism to train a neural network to play tic tac toe
 
 from network import *
 from game import *
-from random import randint
+from exhaustive import evaluate_exhaustive
+from opponents import DEFAULT_MIX, evaluate_mix
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from statistics import NormalDist
 import pickle
 import sys
+import uuid
+import checkpoint
+from metrics import memory_rss
 
 
+INITIAL_RATING = 1500.0 # Elo rating of a new individual
+
+
+def survivor_count(pop_size, carry_over_pct):
+    """Return how many individuals carry over each generation
+
+    Raises:
+        ValueError: if fewer than 2 would, the best one is not bred from so
+            there would be nobody to breed the next generation.
+    """
+    carry_over_size = int(pop_size * carry_over_pct)
+    if carry_over_size < 2:
+        raise ValueError("a population of %i with %g carried over keeps %i individuals, at least 2 are needed"
+                         % (pop_size, carry_over_pct, carry_over_size))
+    return carry_over_size
+
 ### Individual
 class Individual(object):
     """ Wrapper for a neural net to play a game and keep track of results """
+    __slots__ = ("wins", "losses", "ties", "rating", "generation", "net")
+
     def __init__(self, generation, network):
         self.wins, self.losses, self.ties = 0, 0, 0
+        self.rating = INITIAL_RATING # from tournaments, kept across generations
         self.generation = generation
         self.net = network
-        self.player = NeuralnetPlayer(network, self)
 
-    def get_game_player(self): return NeuralnetPlayer(self.network, self)
+    @property
+    def player(self):
+        """A new ``NeuralnetPlayer`` for the network that records its games here"""
+        return NeuralnetPlayer(self.net, self)
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        # individuals pickled before __slots__ have no rating and also have a player
+        self.rating = INITIAL_RATING
+        for name, value in state.items():
+            if name in self.__slots__:
+                setattr(self, name, value)
 
     def fitness(self):
         # Winning and tying is ok but loosing is bad
         return self.wins + self.ties - 6 * self.losses
 
+    def games(self):
+        return self.wins + self.losses + self.ties
+
+    def mean_fitness(self):
+        """Fitness per game, to compare individuals that played different numbers of games"""
+        games = self.games()
+        return self.fitness() / games if games else 0.0
+
+
+### History
+class History(object):
+    """The best individual of the last ``capacity`` generations, kept as a
+    ring buffer of float32 weights and small stats records instead of the
+    individuals themselves, so it stays the same size however long training
+    runs. Each record remembers the population ``at_generation`` it was
+    the best of."""
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.weights = None # (capacity, n_params), allocated with the first record
+        self.stats = deque(maxlen=capacity)
+        self.start = 0 # row of the oldest record
+
+    def __len__(self):
+        return len(self.stats)
+
+    def append(self, at_generation, individual):
+        self.add(flatten(individual.net), {
+            "at_generation": at_generation, "generation": individual.generation, "wins": individual.wins,
+            "losses": individual.losses, "ties": individual.ties, "fitness": individual.fitness()})
+
+    def add(self, row, stats):
+        """Add a record of float32 weights ``row`` and a JSON-able ``stats`` dict"""
+        if self.weights is None or self.weights.shape[1] != len(row):
+            self.weights = np.zeros((self.capacity, len(row)), dtype=np.float32)
+            self.stats.clear()
+            self.start = 0
+        # when it is full this is the row of the oldest record, which is dropped
+        self.weights[(self.start + len(self.stats)) % self.capacity] = row
+        if len(self.stats) == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        self.stats.append(stats)
+
+    def records(self):
+        """Return (weights, stats) of every record, oldest first"""
+        if self.weights is None:
+            return np.zeros((0, 0), dtype=np.float32), []
+        rows = (self.start + np.arange(len(self.stats))) % self.capacity
+        return self.weights[rows], list(self.stats)
+
+    def since(self, at_generation):
+        """Return (weights, stats) of the records newer than ``at_generation``, oldest first"""
+        weights, stats = self.records()
+        first = len(stats)
+        while first and stats[first - 1]["at_generation"] > at_generation:
+            first -= 1
+        return weights[first:], stats[first:]
+
+    def __getstate__(self):
+        # only the rows in use, not the whole buffer
+        weights, stats = self.records()
+        return {"capacity": self.capacity, "weights": weights, "stats": stats}
+
+    def __setstate__(self, state):
+        self.__init__(state["capacity"])
+        for row, stats in zip(state["weights"], state["stats"]):
+            self.add(row, stats)
+
+    def nbytes(self):
+        return 0 if self.weights is None else self.weights.nbytes
+
 
 ### Population
 class Population(object):
+    # defaults for populations pickled before these settings existed
+    workers = 1
+    seed = None
+    run_id = None
+    eval_chunk_size = 8
+    checkpoint_path = "saved_population"
+    tournament = None # optional tournament.Tournament played between individuals
+    breeder = None # optional breeding.Breeder, otherwise children come from mutate_network
+    trainer = None # optional gradient.GradientTrainer that also trains every new generation by backprop
+    metrics = None # optional metrics.MetricsStream that gets an event every generation
+    executor = None # the worker processes, started by get_executor and kept until close
+    executor_workers = 0
+    fitness_cache = None # optional cache.FitnessCache so networks that already played do not play again
+    checkpoint_interval = 1 # generations between checkpoints, 0 to never save automatically
+    evaluation = "sampled" # "exhaustive" to score against every opponent line (see exhaustive.py) or "adaptive" to race
+    race_first_games = 10 # games per side in the first round of an adaptive evaluation
+    race_max_games = 100 # per side in all rounds, as many as a sampled evaluation plays
+    race_delta = 0.05 # chance of wrongly dropping an individual in a comparison
+    opponents = DEFAULT_MIX # (opponent, weight) pairs the sampled games are split between, see opponents.py
+    show_progress = True
+    label = "" # printed before each generation's stats, e.g. which island of an islands.py run
+    history_size = 1000 # generations of best individuals kept in memory, older ones are only in checkpoints
 
-    def __init__(self, pop_size, carry_over_pct, net_sizes):
+    def __init__(self, pop_size, carry_over_pct, net_sizes, workers=1, seed=None, activation="sigmoid"):
         """Teach a neural network to play tic tac toe with a genetic algorithm
 
         Args:
@@ -40,64 +171,248 @@ class Population(object):
             carry_over_pct (float 0-1): percentage of individuals that survive
                 or carry over from one generation to the next.
             net_sizes (List[int]): see ``sizes`` in Network for more info.
-            show_progress (Optional[bool]): True to print info for each generation
+            workers (Optional[int]): number of processes used to measure fitness.
+            seed (Optional[int]): seed for the games played while measuring
+                fitness. The same seed gives the same results no matter how
+                many workers are used.
+            activation (Optional[str]): see ``activation`` in Network.
 
         """
+        self.workers = workers
+        self.seed = seed
         self.pop_size = pop_size
-        self.carry_over_size = int(pop_size * carry_over_pct)
+        self.carry_over_size = survivor_count(pop_size, carry_over_pct)
         self.generation = 1
-        self.best_individuals_history = []
+        self.run_id = uuid.uuid4().hex # tells this run's checkpoints apart from others saved at the same path
+        self.best_individuals_history = History(self.history_size)
         self.pool = []
+        # generation 0 is where the first networks come from, see generation_rng
+        rng = self.generation_rng(0, 0)
         for i in range(pop_size):
-            network = Network(net_sizes)
+            network = Network(net_sizes, activation=activation, rng=rng)
             individual = Individual(self.generation, network)
             self.pool.append(individual)
 
+    def __getstate__(self):
+        # a metrics stream is an open file and the executor is processes, neither is saved
+        state = self.__dict__.copy()
+        state.pop("metrics", None)
+        state.pop("executor", None)
+        state.pop("executor_workers", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        history = state.get("best_individuals_history")
+        if isinstance(history, list):
+            # pickled when the history was a list of every best individual
+            self.best_individuals_history = History(self.history_size)
+            first = self.generation - len(history)
+            for n, i in enumerate(history):
+                self.best_individuals_history.append(first + n, i)
+
+    def generation_seed(self, generation, stream):
+        """Return the ``np.random.SeedSequence`` of one stream of randomness
+        in a generation. Every generation has its own streams, all derived
+        from ``seed``, so a run can be repeated and a resumed run goes on
+        exactly as if it had never stopped:
+
+            0   fitness, one child sequence per chunk of networks (so per
+                worker job) and the one after them for the tournament
+            1   breeding
+            2   gradient training
+            3   adaptive fitness, one child sequence per chunk of every round
+
+        Generation 0 stream 0 makes the first networks.
+        """
+        return np.random.SeedSequence(self.seed, spawn_key=(generation, stream))
+
+    def generation_rng(self, generation, stream):
+        return np.random.default_rng(self.generation_seed(generation, stream))
+
+    def get_executor(self):
+        """Return the process pool that measures fitness, or None with a
+        single worker. It is started on first use and reused by every
+        generation after that, so only the first one pays for starting the
+        processes. ``close`` stops it."""
+        if self.workers <= 1:
+            self.close()
+            return None
+        if self.executor is None or self.executor_workers != self.workers:
+            self.close()
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            self.executor_workers = self.workers
+        return self.executor
+
+    def close(self):
+        """Stop the worker processes, the next generation starts new ones"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
     def measure_fitness(self):
-        """Measure the fitness of each neural network by playing games of tic tac toe"""
+        """Measure the fitness of each neural network by playing games of tic tac toe
+
+        Returns:
+            int: the number of games played.
+        """
 
         num_games_vs_rand = 100
-        total_games = float(self.pop_size * (num_games_vs_rand * 2))
-        print_interval = total_games / 100.0
-        games_played = 0
 
-        def print_progress():
-            if games_played % print_interval == 0:
-                percent = games_played / total_games * 100
-                sys.stdout.write("\rMeasuring fitness: %1.0f%% through generation" % percent)
-                sys.stdout.flush()
+        to_play = self.pool
+        cache = self.fitness_cache if self.evaluation != "adaptive" else None
+        if cache is not None:
+            context = (self.evaluation, self.opponents)
+            keys = [cache.key(i.net, context) for i in self.pool]
+            cached = [cache.get(key) for key in keys]
+            for i, results in zip(self.pool, cached):
+                if results is not None:
+                    i.wins, i.losses, i.ties = results
+            if not cache.accumulate:
+                to_play = [i for i, results in zip(self.pool, cached) if results is None]
 
-        for i in self.pool:
-            # play random player 500 times as player X and 500 times as player O (1000 games total)
-            for cnt in range(num_games_vs_rand):
-                Game(i.player, RandomPlayer()).play_game()
-                Game(RandomPlayer(), i.player).play_game()
-                games_played += 2
-                print_progress()
+        # one child seed per chunk, then the next one for the tournament
+        fitness_seed = self.generation_seed(self.generation, 0)
+        games_played = 0
+        if self.evaluation == "adaptive":
+            games_played = self.race(self.get_executor())
+        elif to_play:
+            # the processes are only needed once something has to play
+            chunks = self.chunk_individuals(to_play)
+            seeds = fitness_seed.spawn(len(chunks))
+            executor = self.get_executor()
+            if self.evaluation == "exhaustive":
+                jobs = [(stack_weights([i.net for i in chunk]), chunk[0].net.activation) for chunk in chunks]
+                games_played = self.play_jobs(executor, evaluate_exhaustive, chunks, jobs)
+            else:
+                jobs = [(stack_weights([i.net for i in chunk]), num_games_vs_rand, seed, chunk[0].net.activation,
+                         self.opponents) for chunk, seed in zip(chunks, seeds)]
+                games_played = self.play_jobs(executor, evaluate_mix, chunks, jobs)
+        if cache is not None:
+            for i, key in zip(self.pool, keys):
+                cache.put(key, (i.wins, i.losses, i.ties))
 
-            # play againt every other individual (including self, because why not)
-            # for j in self.pool:
-            #     Game(i.player, j.player).play_game()
-            #     games_played += 1
-            #     print_progress()
+        # play against other individuals
+        if self.tournament is not None:
+            games_played += self.tournament.play(self.pool, np.random.default_rng(fitness_seed.spawn(1)[0]))
 
         # clean up the print display
-        print("")
+        if self.show_progress:
+            print("")
+        if self.metrics is not None:
+            self.metrics.lap("evaluate")
         # sort the list, best at the beginning
-        self.pool.sort(key=Individual.fitness, reverse=True)
+        self.pool.sort(key=self.fitness_key(), reverse=True)
+        if self.metrics is not None:
+            self.metrics.lap("sort")
+        return games_played
+
+    def fitness_key(self):
+        """Return what the pool is sorted by. A race, or a cache that
+        accumulates, leaves individuals with different numbers of games, so
+        there it is the fitness per game."""
+        if self.evaluation == "adaptive" or getattr(self.fitness_cache, "accumulate", False):
+            return Individual.mean_fitness
+        return Individual.fitness
+
+    def chunk_individuals(self, individuals):
+        """Split ``individuals`` into the jobs that measure their fitness.
+        Networks with the same shape are stacked and play all of their games
+        at once, in fixed size chunks so the results do not depend on the
+        number of workers."""
+        groups = {}
+        for i in individuals:
+            groups.setdefault((tuple(i.net.sizes), i.net.activation), []).append(i)
+        chunks = []
+        for group in groups.values():
+            for start in range(0, len(group), self.eval_chunk_size):
+                chunks.append(group[start:start + self.eval_chunk_size])
+        return chunks
+
+    def play_jobs(self, executor, evaluate, chunks, jobs, progress="through generation"):
+        """Run ``evaluate(*job)`` for every job, in the worker processes if
+        there is an ``executor``, and add each result to the individuals of
+        its chunk. Returns the number of games played."""
+        if executor is not None:
+            results = executor.map(evaluate, *zip(*jobs))
+        else:
+            results = (evaluate(*job) for job in jobs)
+
+        games_played = 0
+        for done, (chunk, (wins, losses, ties)) in enumerate(zip(chunks, results)):
+            for n, i in enumerate(chunk):
+                i.wins += int(wins[n])
+                i.losses += int(losses[n])
+                i.ties += int(ties[n])
+            games_played += int(wins.sum() + losses.sum() + ties.sum())
+            if self.show_progress:
+                # once per chunk, whole percents are plenty
+                sys.stdout.write("\rMeasuring fitness: %i%% %s" % (100 * (done + 1) // len(chunks), progress))
+                sys.stdout.flush()
+        return games_played
+
+    def race(self, executor):
+        """Measure fitness in rounds, successive halving style: the first
+        round plays ``race_first_games`` games per side and every round after
+        that twice as many, up to ``race_max_games`` per side in all.
+
+        After every round an individual drops out when its fitness per game
+        can not be among the best ``carry_over_size`` any more: the top of its
+        confidence interval is below the bottom of the interval of that many
+        others. A game is worth 1 unless it is lost, so the interval comes
+        from the loss rate. The later, longer rounds only go to the
+        individuals that are still close. Returns the number of games played.
+        """
+        keep = max(self.carry_over_size, 1)
+        z = NormalDist().inv_cdf(1 - self.race_delta / 2)
+        racing = list(self.pool)
+        games_played, games, round_games = 0, 0, self.race_first_games
+        rounds = self.generation_seed(self.generation, 3)
+        while games < self.race_max_games:
+            round_games = min(round_games, self.race_max_games - games)
+            chunks = self.chunk_individuals(racing)
+            seeds = rounds.spawn(len(chunks))
+            jobs = [(stack_weights([i.net for i in chunk]), round_games, seed, chunk[0].net.activation,
+                     self.opponents) for chunk, seed in zip(chunks, seeds)]
+            games_played += self.play_jobs(executor, evaluate_mix, chunks, jobs,
+                                           "of a round of %i games, %i racing" % (round_games, len(racing)))
+            games += round_games
+            round_games *= 2
+            if len(racing) <= keep:
+                break
+
+            played = np.array([i.games() for i in racing], dtype=float)
+            # fitness per game is 1 - 7 * loss rate, smoothed so no rate is exactly 0 or 1
+            rate = (np.array([i.losses for i in racing]) + 1) / (played + 2)
+            mean = 1 - 7 * rate
+            margin = 7 * z * np.sqrt(rate * (1 - rate) / played)
+            # the lowest fitness the keep-th best can still have
+            bar = np.sort(mean - margin)[-keep]
+            racing = [i for i, top in zip(racing, mean + margin) if top >= bar]
+        return games_played
 
     def print_current_stats(self):
         best = self.pool[0]
-        self.best_individuals_history.append(best)
-        print("Current gen: %i | best: %i from gen %i with %i losses" % (self.generation, best.fitness(), best.generation, best.losses))
+        self.best_individuals_history.append(self.generation, best)
+        print("%sCurrent gen: %i | best: %i from gen %i with %i losses"
+              % (self.label, self.generation, best.fitness(), best.generation, best.losses))
 
     def advance_one_generation(self):
         """create a new generation based on the fitness of the current generation.
         After measureing the fitness of each individual, cull the cream of the
         crop and breed them using mutation to produce a more fit generation
         """
-        self.measure_fitness()
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.start_generation(self.generation)
 
+        games_played = self.measure_fitness()
+
+        if metrics is not None:
+            metrics.record(games_played=games_played)
+            metrics.record_pool(self.pool, self.fitness_key())
+            if self.fitness_cache is not None:
+                metrics.record(**self.fitness_cache.stats())
         self.print_current_stats()
 
         new_pool = []
@@ -110,21 +425,137 @@ class Population(object):
 
         self.generation += 1
 
-        # breed the rest of the new generation
-        while True:
-            for i in new_pool:
-                child = mutate_network(i.net)
-                childIndividual = Individual(self.generation, child)
-                new_pool.append(childIndividual)
-                if len(new_pool) == self.pop_size:
-                    self.pool = new_pool
-                    self.save_to_file("saved_population.p")
-                    return
+        if self.breeder is not None:
+            new_pool = self.breed_generation(new_pool)
+        else:
+            # breed the rest of the new generation
+            rng = self.generation_rng(self.generation, 1)
+            while len(new_pool) < self.pop_size:
+                for i in new_pool:
+                    child = mutate_network(i.net, rng)
+                    childIndividual = Individual(self.generation, child)
+                    new_pool.append(childIndividual)
+                    if len(new_pool) == self.pop_size:
+                        break
+        self.pool = new_pool
+        if metrics is not None:
+            metrics.lap("breed")
+
+        if self.trainer is not None:
+            self.trainer.train_pool(self.pool, self.generation_rng(self.generation, 2))
+            if metrics is not None:
+                metrics.lap("train")
+
+        if self.checkpoint_interval and self.generation % self.checkpoint_interval == 0:
+            self.save_checkpoint(self.checkpoint_path)
+        if metrics is not None:
+            metrics.lap("save")
+            metrics.record(**self.memory_report())
+            metrics.end_generation()
+
+    def memory_report(self):
+        """Return the memory used by the process and by the population's
+        weights and history, in bytes"""
+        pool_bytes = sum(w.nbytes for i in self.pool for w in i.net.weights + (i.net.biases or []))
+        return {"rss_bytes": memory_rss(), "pool_bytes": pool_bytes,
+                "history_bytes": self.best_individuals_history.nbytes(),
+                "history_records": len(self.best_individuals_history)}
+
+    def breed_generation(self, survivors):
+        """Return the new pool: ``survivors`` followed by children bred by
+        ``self.breeder`` from the whole (sorted) pool. The weights of the new
+        pool are one (pop_size, n_params) array and every network's weights
+        are views into it."""
+        net = self.pool[0].net
+        sizes, activation = net.sizes, net.activation
+        genomes = np.stack([flatten(i.net, net.weights[0].dtype) for i in self.pool])
+        rng = self.generation_rng(self.generation, 1)
+        children = self.breeder.breed(genomes, self.pop_size - len(survivors), rng)
+
+        # the survivors are the first rows since the pool is sorted best first
+        genomes = np.concatenate([genomes[:len(survivors)], children])
+        new_pool = []
+        for row, i in zip(genomes, survivors):
+            i.net.weights, i.net.biases = unflatten(row, sizes)
+            new_pool.append(i)
+        for row in genomes[len(survivors):]:
+            weights, biases = unflatten(row, sizes)
+            new_pool.append(Individual(self.generation, Network(sizes, weights, activation, biases=biases)))
+        return new_pool
 
     def save_to_file(self, filename):
         """Save the population to the file ``filename``."""
         pickle.dump(self, open(filename, "wb"))
 
+    def save_checkpoint(self, path):
+        """Save the population to the checkpoint directory ``path``. Only the
+        history records newer than the checkpoint's history are written."""
+        sizes, activation = self.pool[0].net.sizes, self.pool[0].net.activation
+        if any(i.net.sizes != sizes or i.net.activation != activation for i in self.pool):
+            raise ValueError("every network must have the same sizes and activation to be checkpointed")
+
+        meta = {"pop_size": self.pop_size, "carry_over_size": self.carry_over_size,
+                "generation": self.generation, "sizes": list(sizes), "activation": activation,
+                "workers": self.workers, "seed": self.seed, "history_generation": self.generation - 1,
+                "individuals": [{"generation": i.generation, "wins": i.wins, "losses": i.losses,
+                                 "ties": i.ties, "rating": i.rating} for i in self.pool]}
+        # in the networks' dtype, float32 would round float64 weights and a resumed run would drift
+        weights = np.stack([flatten(i.net, self.pool[0].net.weights[0].dtype) for i in self.pool])
+        meta["n_params"] = weights.shape[1] # with or without biases
+
+        meta["run_id"] = self.run_id
+        saved = 0
+        same_run = False
+        if checkpoint.is_checkpoint(path):
+            old_meta = checkpoint.read_meta(path)
+            saved = checkpoint_history_generation(path)
+            if old_meta.get("run_id") is not None:
+                same_run = old_meta["run_id"] == self.run_id
+            else:
+                # saved before runs had ids, a later generation is all there is to go by
+                same_run = self.generation > saved
+        if not same_run:
+            # a new population saved over another run's checkpoint writes its own history from the start
+            saved = 0
+        history_weights, history_stats = self.best_individuals_history.since(saved)
+
+        checkpoint.write_checkpoint(path, meta, weights, history_weights, history_stats, append_history=same_run)
+
+
+def checkpoint_history_generation(path):
+    """Return the generation of the newest history record in the checkpoint at ``path``"""
+    meta = checkpoint.read_meta(path)
+    # checkpoints from before it was recorded have a record for every generation so far
+    return meta.get("history_generation", meta["generation"] - 1)
+
+
+def load_population_from_checkpoint(path):
+    """Load a population from the checkpoint directory ``path``. Returns an
+    instance of Population whose networks are views into the memory-mapped
+    weights (so they are read-only). The history stays on disk, see
+    ``checkpoint.read_history``.
+    """
+    meta, weights = checkpoint.read_checkpoint(path)
+    pop = Population.__new__(Population) # skip creating random networks
+    pop.pop_size = meta["pop_size"]
+    pop.carry_over_size = meta["carry_over_size"]
+    pop.generation = meta["generation"]
+    pop.workers = meta["workers"]
+    pop.seed = meta["seed"]
+    # checkpoints from before runs had ids go on as a run of their own
+    pop.run_id = meta.get("run_id") or uuid.uuid4().hex
+    pop.checkpoint_path = path
+    pop.best_individuals_history = History(pop.history_size)
+    pop.pool = []
+    for row, stats in zip(weights, meta["individuals"]):
+        weights, biases = unflatten(np.asarray(row), meta["sizes"])
+        network = Network(meta["sizes"], weights, meta["activation"], biases=biases)
+        individual = Individual(stats["generation"], network)
+        individual.wins, individual.losses, individual.ties = stats["wins"], stats["losses"], stats["ties"]
+        individual.rating = stats["rating"]
+        pop.pool.append(individual)
+    return pop
+
 
 def load_population_from_file(filename):
     """Load a population from the file ``filename``.  Returns an
@@ -0,0 +1,76 @@
+""" gradient.py
+~~~~~~~~~~~~~~~
+Supervised training for networks, as a much faster alternative (or a
+companion) to the genetic algorithm. Every position that can come up in a
+game is labelled from the perfectPlay table: seen from the player to move,
+the target is 1 on each perfect move and 0 on every other square. A network
+trained on that with ``Network.SGD`` picks a perfect move whenever its
+highest open output is one of them.
+
+    net = Network([9, 64, 64, 9])
+    GradientTrainer(epochs=200).train(net)
+    accuracy(net) # fraction of positions where the network's move is perfect
+
+Give a ``GradientTrainer`` to ``Population.trainer`` and every network of
+each new generation is also trained by backprop.
+
+"""
+
+import numpy as np
+
+from batchGame import best_legal_moves
+from perfectPlay import POWERS, get_table
+
+_data = None
+
+
+def perfect_play_data():
+    """Return (inputs, targets), one row for each position a player can move
+    in: the board from the mover's point of view (1, -1 and 0) and a 1 on
+    every perfect move."""
+    global _data
+    if _data is None:
+        table = get_table()
+        keys = np.nonzero(table["reachable"] & (table["best_moves"] != 0))[0]
+        digits = (keys[:, np.newaxis] // POWERS) % 3
+        boards = np.where(digits == 2, -1, digits).astype(np.int8)
+        # O is to move when X has played more, turn the board around so the mover is 1
+        o_to_move = (boards == 1).sum(axis=1) > (boards == -1).sum(axis=1)
+        boards[o_to_move] *= -1
+        targets = (table["best_moves"][keys][:, np.newaxis] >> np.arange(9) & 1).astype(np.int8)
+        _data = boards, targets
+    return _data
+
+
+def accuracy(net):
+    """Return the fraction of positions where ``net`` picks a perfect move"""
+    inputs, targets = perfect_play_data()
+    moves = best_legal_moves(net.feedforward(inputs.T).T, inputs)
+    return float(targets[np.arange(len(moves)), moves].mean())
+
+
+### GradientTrainer
+class GradientTrainer(object):
+
+    def __init__(self, epochs=1, mini_batch_size=16, eta=0.5, lmbda=0.0):
+        """Settings for training networks on ``perfect_play_data``.
+
+        Args:
+            epochs (int): passes over the data each time a network is trained.
+            mini_batch_size (int): positions per gradient step.
+            eta (float): the learning rate.
+            lmbda (float): the L2 regularization parameter.
+        """
+        self.epochs = epochs
+        self.mini_batch_size = mini_batch_size
+        self.eta = eta
+        self.lmbda = lmbda
+
+    def train(self, net, rng=None):
+        inputs, targets = perfect_play_data()
+        net.SGD(inputs, targets, self.epochs, self.mini_batch_size, self.eta, self.lmbda, rng)
+
+    def train_pool(self, individuals, rng):
+        """Train the network of every individual, ``rng`` shuffles the data"""
+        for i in individuals:
+            self.train(i.net, rng)
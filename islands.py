@@ -0,0 +1,175 @@
+""" islands.py
+~~~~~~~~~~~~~~
+The island model: several populations evolve at the same time, each in its
+own process, and every ``migration_interval`` generations each island sends
+copies of its ``migrants`` best networks to the next island in a ring. The
+migrants take the places of the receiving island's last children. Islands
+wait for their migrants, so a seeded run is repeatable however the
+processes are scheduled.
+
+    $ python pyTacToe.py islands --islands 4 --generations 100 --migration-interval 5 --seed 1
+
+Migrants travel over ``multiprocessing`` queues and the islands report their
+best network to the parent process, which keeps the global best. Island
+``i`` uses ``[seed, i]`` as its seed and checkpoints to ``<checkpoint>-island-i``,
+so an interrupted run can be continued and each island can be used like any
+other population (``--checkpoint saved_population-island-2``).
+
+"""
+
+import multiprocessing
+import queue
+import traceback
+
+from checkpoint import is_checkpoint
+from geneticAlgorithm import Individual, Population, load_population_from_checkpoint, survivor_count
+from network import Network, unflatten
+
+
+POLL_SECONDS = 1.0 # how often the parent checks that no island died without a word
+
+
+def island_checkpoint(checkpoint, island):
+    return "%s-island-%i" % (checkpoint, island)
+
+
+def best_report(pop):
+    """Return the best individual of the last generation of ``pop`` as plain
+    values: its stats from the history, its float32 weights and its shape"""
+    weights, stats = pop.best_individuals_history.since(pop.generation - 2)
+    report = dict(stats[-1])
+    report.update(weights=weights[-1], sizes=list(pop.pool[0].net.sizes), activation=pop.pool[0].net.activation)
+    return report
+
+
+def fitness_per_game(report):
+    games = report["wins"] + report["losses"] + report["ties"]
+    return report["fitness"] / games if games else 0.0
+
+
+def report_network(report):
+    weights, biases = unflatten(report["weights"], report["sizes"])
+    return Network(report["sizes"], weights, report["activation"], biases=biases)
+
+
+#### Islands
+def make_island(island, options):
+    """Return the population of ``island``, resumed from its checkpoint if
+    there is one, with the settings of ``options``"""
+    checkpoint = options["checkpoint"]
+    pop = None
+    if checkpoint is not None and not options["new"] and is_checkpoint(island_checkpoint(checkpoint, island)):
+        pop = load_population_from_checkpoint(island_checkpoint(checkpoint, island))
+    if pop is None:
+        seed = None if options["seed"] is None else [options["seed"], island]
+        pop = Population(options["pop_size"], options["carry_over_pct"], list(options["net_sizes"]),
+                         workers=1, seed=seed, activation=options["activation"])
+    pop.workers = 1
+    pop.label = "island %i: " % island
+    if checkpoint is None:
+        pop.checkpoint_interval = 0
+    else:
+        pop.checkpoint_path = island_checkpoint(checkpoint, island)
+    for name, value in options["settings"].items():
+        setattr(pop, name, value)
+    return pop
+
+
+def run_island(island, options, inbox, outbox, results):
+    """Evolve one island in its own process. Every message to ``results`` is
+    a tuple of (kind, island, payload), kind is "best", "done" or "error"."""
+    try:
+        pop = make_island(island, options)
+        interval, migrants = options["migration_interval"], options["migrants"]
+        for step in range(1, options["generations"] + 1):
+            pop.advance_one_generation()
+            # counted in steps of this run, not generations, so resumed islands still migrate together
+            if interval and step % interval == 0:
+                if migrants and options["islands"] > 1:
+                    outbox.put([i.net for i in pop.pool[:migrants]])
+                    for n, net in enumerate(inbox.get()):
+                        pop.pool[-1 - n] = Individual(pop.generation, net)
+                if step < options["generations"]:
+                    results.put(("best", island, best_report(pop)))
+        if options["checkpoint"] is not None:
+            pop.save_checkpoint(pop.checkpoint_path)
+        results.put(("done", island, best_report(pop)))
+    except Exception:
+        results.put(("error", island, traceback.format_exc()))
+
+
+def run_islands(islands, generations, pop_size=200, carry_over_pct=0.1, net_sizes=(9, 18, 12, 9),
+                activation="sigmoid", seed=None, migration_interval=5, migrants=2, checkpoint=None,
+                new=False, settings=None, show_progress=True):
+    """Evolve ``islands`` populations for ``generations`` generations each.
+
+    Args:
+        migration_interval (int): generations between migrations, 0 to never
+            migrate.
+        migrants (int): best networks each island sends to the next one.
+        checkpoint (Optional[str]): island checkpoints are saved next to it,
+            see ``island_checkpoint``. None saves nothing.
+        new (bool): start new populations even if island checkpoints exist.
+        settings (Optional[dict]): ``Population`` attributes set on every
+            island, e.g. {"evaluation": "adaptive"}.
+
+    Returns:
+        tuple: the global best ``Network`` and the report of the island it
+        came from (its stats, "island" and "at_generation").
+
+    Raises:
+        RuntimeError: if an island fails or its process dies, the other
+            islands are stopped.
+    """
+    if islands < 1:
+        raise ValueError("there must be at least one island")
+    if generations < 1:
+        raise ValueError("the islands must train at least one generation")
+    if migrants >= pop_size:
+        raise ValueError("migrants must be fewer than the population size")
+    survivor_count(pop_size, carry_over_pct) # fail here instead of in every island
+    options = {"islands": islands, "generations": generations, "pop_size": pop_size,
+               "carry_over_pct": carry_over_pct, "net_sizes": list(net_sizes), "activation": activation,
+               "seed": seed, "migration_interval": migration_interval, "migrants": migrants,
+               "checkpoint": checkpoint, "new": new,
+               "settings": dict(settings or {}, show_progress=False)}
+
+    # island i reads inboxes[i] and writes to the inbox of the next island
+    inboxes = [multiprocessing.Queue() for _ in range(islands)]
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=run_island, name="island-%i" % i,
+                                         args=(i, options, inboxes[i], inboxes[(i + 1) % islands], results))
+                 for i in range(islands)]
+    for process in processes:
+        process.start()
+
+    best = None
+    done = set()
+    try:
+        while len(done) < islands:
+            try:
+                kind, island, report = results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                # an island that is killed (out of memory, a crash) never sends its error
+                for island, process in enumerate(processes):
+                    if island not in done and process.exitcode not in (None, 0):
+                        raise RuntimeError("island %i died with exit code %i" % (island, process.exitcode))
+                continue
+            if kind == "error":
+                raise RuntimeError("island %i failed:\n%s" % (island, report))
+            if kind == "done":
+                done.add(island)
+            report["island"] = island
+            if best is None or fitness_per_game(report) > fitness_per_game(best):
+                best = report
+            if show_progress:
+                print("[island %i at generation %i: best %.3f per game | global best %.3f from island %i]"
+                      % (island, report["at_generation"], fitness_per_game(report),
+                         fitness_per_game(best), best["island"]))
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    return report_network(best), best
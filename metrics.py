@@ -0,0 +1,126 @@
+""" metrics.py
+~~~~~~~~~~~~~~
+Structured per-generation telemetry for training. Give a ``MetricsStream`` to
+``Population.metrics`` and every generation appends one event to a JSONL (or
+CSV, picked by the file extension) file:
+
+    generation, timestamp, games_played,
+    fitness_best, fitness_median, fitness_mean, fitness_worst, fitness_std,
+    losses_best, losses_median,
+    evaluate_seconds, sort_seconds, breed_seconds, train_seconds, save_seconds, total_seconds,
+    rss_bytes, pool_bytes, history_bytes, history_records,
+    cache_hits, cache_misses, cache_evictions, cache_hit_rate, cache_size
+
+It can also run cProfile over the first ``profile_generations`` generations
+and dump the stats for ``pstats`` or snakeviz. When ``Population.metrics`` is
+None none of this runs at all.
+
+"""
+
+import cProfile
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+FIELDS = ("generation", "timestamp", "games_played",
+          "fitness_best", "fitness_median", "fitness_mean", "fitness_worst", "fitness_std",
+          "losses_best", "losses_median",
+          "evaluate_seconds", "sort_seconds", "breed_seconds", "train_seconds", "save_seconds", "total_seconds",
+          "rss_bytes", "pool_bytes", "history_bytes", "history_records",
+          "cache_hits", "cache_misses", "cache_evictions", "cache_hit_rate", "cache_size")
+
+
+def memory_rss():
+    """Return the resident set size of this process in bytes, or the peak
+    size where the current one is not available (0 if neither is)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # bytes on macOS, KB elsewhere
+
+
+### MetricsStream
+class MetricsStream(object):
+
+    def __init__(self, filename, profile_generations=0, profile_file="training.prof"):
+        """Append generation events to ``filename``.
+
+        Args:
+            filename (Optional[str]): a .csv file gets CSV rows, anything
+                else JSON lines. None writes no events, to only profile.
+            profile_generations (int): profile this many generations with cProfile.
+            profile_file (str): where the profile stats are dumped.
+        """
+        self.filename = filename
+        self.is_csv = filename is not None and filename.lower().endswith(".csv")
+        self.file = open(filename, "a") if filename is not None else None
+        self.writer = None
+        if self.is_csv:
+            self.writer = csv.DictWriter(self.file, FIELDS, extrasaction="ignore")
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+        self.profile_generations = profile_generations
+        self.profile_file = profile_file
+        self.profiler = None
+        self.profiled = 0
+        self.event = None
+
+    def start_generation(self, generation):
+        if self.profiled < self.profile_generations:
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.event = {"generation": generation, "timestamp": time.time()}
+        self.start = self.last_lap = time.perf_counter()
+
+    def lap(self, name):
+        """Put the time since the last lap (or the start) in ``<name>_seconds``"""
+        now = time.perf_counter()
+        self.event[name + "_seconds"] = now - self.last_lap
+        self.last_lap = now
+
+    def record(self, **fields):
+        self.event.update(fields)
+
+    def record_pool(self, pool, key=None):
+        """Record the fitness distribution of a pool that is sorted best
+        first, by ``key`` (each individual's ``fitness()`` by default)"""
+        key = key or (lambda i: i.fitness())
+        fitness = np.array([key(i) for i in pool], dtype=float)
+        self.record(fitness_best=float(fitness[0]), fitness_median=float(np.median(fitness)),
+                    fitness_mean=float(fitness.mean()), fitness_worst=float(fitness[-1]),
+                    fitness_std=float(fitness.std()), losses_best=pool[0].losses,
+                    losses_median=pool[len(pool) // 2].losses)
+
+    def end_generation(self):
+        self.event["total_seconds"] = time.perf_counter() - self.start
+        if self.profiler is not None and self.profiled < self.profile_generations:
+            self.profiler.disable()
+            self.profiled += 1
+            if self.profiled == self.profile_generations:
+                self.profiler.dump_stats(self.profile_file)
+
+        if self.file is not None:
+            if self.is_csv:
+                self.writer.writerow(self.event)
+            else:
+                self.file.write(json.dumps(self.event) + "\n")
+            self.file.flush()
+        self.event = None
+
+    def close(self):
+        if self.profiler is not None and 0 < self.profiled < self.profile_generations:
+            self.profiler.dump_stats(self.profile_file) # stopped early, keep what we have
+        if self.file is not None:
+            self.file.close()
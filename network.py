@@ -7,24 +7,36 @@ Stolen and modified from https://github.com/mnielsen/neural-networks-and-deep-le
 #### Libraries
 # Standard library
 import json
-import random
 
 # Third-party libraries
 import numpy as np
 
 #### Main Network class
 class Network():
+    activation = "sigmoid" # default for networks pickled before activations were configurable
+    biases = None # networks pickled before biases came back do not have any
 
-    def __init__(self, sizes, weights=None):
+    def __init__(self, sizes, weights=None, activation="sigmoid", dtype=None, biases=None, rng=None):
         """The list ``sizes`` contains the number of neurons in the respective
         layers of the network.  For example, if the list was [2, 3, 1]
         then it would be a three-layer network, with the first layer
         containing 2 neurons, the second layer 3 neurons, and the
         third layer 1 neuron.
 
-        If no ``weights`` are provided they will be generated randomly.
+        If no ``weights`` are provided they will be generated randomly, and
+        so will the biases. Given ``weights`` only get ``biases`` if those are
+        given as well, otherwise the network has none (the same as all zero).
+        Random values come from ``rng``, an ``np.random.Generator`` (a new
+        unseeded one if it is None).
+
+        ``activation`` is the name of one of ``ACTIVATIONS`` and ``dtype``
+        (for example np.float32) is the type of the weights and of every
+        computation, it defaults to float64 or to the type of ``weights``.
 
         """
+        if activation not in ACTIVATIONS:
+            raise ValueError("activation must be one of %s" % sorted(ACTIVATIONS))
+        self.activation = activation
         self.num_layers = len(sizes)
         self.sizes = sizes
 
@@ -40,26 +52,122 @@ class Network():
         layers.
 
         """
-        # self.biases = [np.random.randn(y, 1) for y in self.sizes[1:]] # omit using a bias for now
         if weights is None:
-            self.weights = [np.random.randn(y, x)/np.sqrt(x)
+            if rng is None:
+                rng = np.random.default_rng()
+            self.weights = [(rng.standard_normal((y, x))/np.sqrt(x)).astype(dtype or np.float64, copy=False)
                             for x, y in zip(self.sizes[:-1], self.sizes[1:])]
+            self.biases = [rng.standard_normal((y, 1)).astype(dtype or np.float64, copy=False)
+                           for y in self.sizes[1:]]
+        elif dtype is not None:
+            self.weights = [w.astype(dtype, copy=False) for w in weights]
+            if biases is not None:
+                self.biases = [b.astype(dtype, copy=False) for b in biases]
         else:
             self.weights = weights
+            if biases is not None:
+                self.biases = biases
 
     def feedforward(self, a):
-        """Return the output of the network if ``a`` is input."""
-        # for b, w in zip(self.biases, self.weights): # omit using a bias for now
-        #     a = sigmoid_vec(np.dot(w, a)+b)
-        for w in self.weights:
-            a = sigmoid_vec(np.dot(w, a))
+        """Return the output of the network if ``a`` is input.
+
+        ``a`` is either one input or an array with one input per column.
+        The activation runs in place on each layer's product, so every
+        layer allocates one array.
+        """
+        a = np.asarray(a, dtype=self.weights[0].dtype)
+        activation = ACTIVATIONS[self.activation]
+        for l, w in enumerate(self.weights):
+            z = np.dot(w, a)
+            if self.biases is not None:
+                # biases are columns, a single input is not
+                z += self.biases[l] if z.ndim > 1 else self.biases[l][:, 0]
+            a = activation(z, out=z)
         return a
 
+    def SGD(self, inputs, targets, epochs, mini_batch_size, eta, lmbda=0.0, rng=None):
+        """Train the network using mini-batch stochastic gradient descent.
+
+        ``inputs`` is an (n, x) array with one training input per row and
+        ``targets`` the (n, y) array of the outputs wanted for them. Each
+        mini-batch is one matrix, so a whole batch goes through the network
+        and back in a few matrix multiplies. ``lmbda`` is the L2
+        regularization parameter and ``rng`` (an ``np.random.Generator``)
+        shuffles the data every epoch.
+
+        The cost is cross-entropy for sigmoid networks and quadratic for the
+        other activations. The weights and biases are replaced by new arrays
+        rather than changed in place, so networks whose weights are views
+        into a population's genomes (or a memory-mapped checkpoint) are safe
+        to train.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        dtype = self.weights[0].dtype
+        if self.biases is None:
+            self.biases = [np.zeros((y, 1), dtype=dtype) for y in self.sizes[1:]]
+        inputs = np.asarray(inputs, dtype=dtype)
+        targets = np.asarray(targets, dtype=dtype)
+        n = len(inputs)
+        for j in range(epochs):
+            order = rng.permutation(n)
+            for k in range(0, n, mini_batch_size):
+                batch = order[k:k + mini_batch_size]
+                self.update_mini_batch(inputs[batch].T, targets[batch].T, eta, lmbda, n)
+
+    def update_mini_batch(self, x, y, eta, lmbda, n):
+        """Update the network's weights and biases by applying gradient
+        descent using backpropagation to a single mini batch. ``x`` and ``y``
+        hold one input and target per column, ``eta`` is the learning rate,
+        ``lmbda`` is the regularization parameter, and ``n`` is the total
+        size of the training data set.
+        """
+        nabla_b, nabla_w = self.backprop(x, y)
+        m = x.shape[1]
+        self.weights = [(1-eta*(lmbda/n))*w-(eta/m)*nw
+                        for w, nw in zip(self.weights, nabla_w)]
+        self.biases = [b-(eta/m)*nb
+                       for b, nb in zip(self.biases, nabla_b)]
+
+    def backprop(self, x, y):
+        """Return a tuple ``(nabla_b, nabla_w)`` representing the gradient
+        of the cost summed over the columns of ``x`` (inputs) and ``y``
+        (targets). ``nabla_b`` and ``nabla_w`` are layer-by-layer lists of
+        numpy arrays, similar to ``self.biases`` and ``self.weights``."""
+        activation = ACTIVATIONS[self.activation]
+        prime = ACTIVATION_PRIMES[self.activation]
+        # feedforward, keeping every layer's activations
+        activations = [x]
+        for b, w in zip(self.biases, self.weights):
+            activations.append(activation(np.dot(w, activations[-1]) + b))
+        # backward pass
+        delta = activations[-1] - y
+        if self.activation != "sigmoid":
+            delta *= prime(activations[-1]) # quadratic cost, sigmoid uses cross-entropy
+        nabla_b = [None] * len(self.weights)
+        nabla_w = [None] * len(self.weights)
+        for l in range(len(self.weights) - 1, -1, -1):
+            nabla_b[l] = delta.sum(axis=1, keepdims=True)
+            nabla_w[l] = np.dot(delta, activations[l].T)
+            if l:
+                delta = np.dot(self.weights[l].T, delta) * prime(activations[l])
+        return (nabla_b, nabla_w)
+
+    def total_cost(self, inputs, targets):
+        """Return the mean cost (see ``SGD``) over the rows of ``inputs`` and ``targets``"""
+        a = self.feedforward(np.asarray(inputs).T).T
+        if self.activation == "sigmoid":
+            a = np.clip(a, 1e-12, 1 - 1e-12)
+            return float(-np.sum(targets*np.log(a) + (1-targets)*np.log(1-a)) / len(inputs))
+        return float(0.5 * np.sum((a - targets) ** 2) / len(inputs))
+
     def save_to_file(self, filename):
         """Save the neural network to the file ``filename``."""
         data = {"sizes": self.sizes,
+                "activation": self.activation,
                 "weights": [w.tolist() for w in self.weights]}
-                # "biases": [b.tolist() for b in self.biases] # omit using a bias for now
+        if self.biases is not None:
+            data["biases"] = [b.tolist() for b in self.biases]
         f = open(filename, "w")
         json.dump(data, f)
         f.close()
@@ -73,40 +181,174 @@ def load_from_file(filename):
     f = open(filename, "r")
     data = json.load(f)
     f.close()
-    net = Network(data["sizes"])
+    net = Network(data["sizes"], activation=data.get("activation", "sigmoid"))
     net.weights = [np.array(w) for w in data["weights"]]
-    # net.biases = [np.array(b) for b in data["biases"]] # omit using a bias for now
+    net.biases = [np.array(b) for b in data["biases"]] if "biases" in data else None
     return net
 
 
+#### Flat parameter vectors
+def num_params(sizes, biases=True):
+    """Return the number of weights (and biases) in a network with the given ``sizes``"""
+    n = sum(x * y for x, y in zip(sizes[:-1], sizes[1:]))
+    if biases:
+        n += sum(sizes[1:])
+    return n
+
+def flatten(net, dtype=np.float32):
+    """Return every weight of ``net`` in one flat array, layer after layer,
+    followed by the biases of every layer if the network has them"""
+    params = [w.ravel() for w in net.weights]
+    if net.biases is not None:
+        params += [b.ravel() for b in net.biases]
+    return np.concatenate(params).astype(dtype, copy=False)
+
+def unflatten(flat, sizes):
+    """Return (weights, biases) for ``sizes`` as lists of matrices that are
+    views into the flat array ``flat`` (no data is copied). ``biases`` is
+    None if ``flat`` only holds weights."""
+    weights, start = [], 0
+    for x, y in zip(sizes[:-1], sizes[1:]):
+        weights.append(flat[start:start + x * y].reshape(y, x))
+        start += x * y
+    if len(flat) == start:
+        return weights, None
+    biases = []
+    for y in sizes[1:]:
+        biases.append(flat[start:start + y].reshape(y, 1))
+        start += y
+    return weights, biases
+
+
+#### Running a whole population of networks at once
+def stack_weights(networks):
+    """Stack the weights of ``networks`` into one 3-D array per layer, shaped
+    (number of networks, y, x + 1): the weights with the biases as the last
+    column (zero for networks without biases). Every network must have the
+    same ``sizes``.
+    """
+    layers = []
+    for l, w in enumerate(networks[0].weights):
+        y, x = w.shape
+        layer = np.zeros((len(networks), y, x + 1), dtype=w.dtype)
+        for n, net in enumerate(networks):
+            layer[n, :, :-1] = net.weights[l]
+            if net.biases is not None:
+                layer[n, :, -1:] = net.biases[l]
+        layers.append(layer)
+    return layers
+
+def feedforward_stack(weights, a, activation="sigmoid"):
+    """Return the output of every stacked network for its own inputs.
+
+    ``weights`` comes from ``stack_weights`` and ``a`` has shape
+    (number of networks, x, number of inputs), so each network gets a
+    column per input and all of them are evaluated with one batched
+    matrix multiply per layer.
+    """
+    activation = ACTIVATIONS[activation]
+    for w in weights:
+        z = np.matmul(w[:, :, :-1], a)
+        z += w[:, :, -1:]
+        a = activation(z, out=z)
+    return a
+
+def feedforward_indexed(weights, index, a, activation="sigmoid", block_size=4096):
+    """Return the output of stacked network ``index[n]`` for input ``a[n]``.
+
+    ``weights`` comes from ``stack_weights``, ``index`` holds one network
+    per input and ``a`` has shape (number of inputs, x). The weights of each
+    input's network are gathered ``block_size`` inputs at a time to keep the
+    memory use bounded.
+    """
+    activation = ACTIVATIONS[activation]
+    outputs = []
+    for start in range(0, len(a), block_size):
+        block = a[start:start + block_size, :, np.newaxis]
+        networks = index[start:start + block_size]
+        for w in weights:
+            w = w[networks]
+            z = np.matmul(w[:, :, :-1], block)
+            z += w[:, :, -1:]
+            block = activation(z, out=z)
+        outputs.append(block[:, :, 0])
+    if not outputs:
+        return np.zeros((0, weights[-1].shape[1]))
+    return np.concatenate(outputs)
+
+
 #### Genetic algorithm related
-def mutate_network(dad):
-    """ return a new child as a mutation of its father """
+def mutate_network(dad, rng=None):
+    """ return a new child as a mutation of its father, ``rng`` is an
+    ``np.random.Generator`` (a new unseeded one if it is None) """
+    if rng is None:
+        rng = np.random.default_rng()
     new_weights = []
     # make a deep copy of the weight matrix between these layers. TODO - find a better way
     for l in range(len(dad.weights)):
         new_weights.append(np.empty_like(dad.weights[l]))
         new_weights[l][:] = dad.weights[l]
+    new_biases = None
+    bias_share = 0.0
+    if dad.biases is not None:
+        new_biases = [b.copy() for b in dad.biases]
+        # biases mutate as often as their share of the parameters says, so
+        # adding them does not take mutations away from the weights
+        num_biases = sum(b.size for b in new_biases)
+        bias_share = num_biases / float(num_biases + sum(w.size for w in new_weights))
 
     chance = 1 # start at a 100% chance that we will mutate something
     num_mutations = 0
-    while random.random() < chance:
-        num_mutations += 1
-        # randomly choose which gene (weight) to mutate
-        l = random.randint(0, len(new_weights) - 1)
-        i = random.randint(0, len(new_weights[l]) - 1)
-        j = random.randint(0, len(new_weights[l][i]) - 1)
+    # draw every random number a child can need at once, there are at most 10 mutations
+    draws = rng.random((10, 5)).tolist()
+    values = rng.standard_normal(10).tolist()
+    while num_mutations < len(draws) and draws[num_mutations][0] < chance:
+        u = draws[num_mutations]
+        # randomly choose which gene (weight or bias) to mutate
+        genes = new_biases if u[4] < bias_share else new_weights
+        l = int(u[1] * len(genes))
+        i = int(u[2] * len(genes[l]))
+        j = int(u[3] * len(genes[l][i]))
         # randomly choose a new value
-        new_weights[l][i][j] = np.random.randn()
+        genes[l][i][j] = values[num_mutations]
+        num_mutations += 1
         # reduce the chance that we mutate again
         chance -= 0.1 # reduce the chance we will mutate by 10%
 
-    return Network(dad.sizes, new_weights)
+    return Network(dad.sizes, new_weights, dad.activation, biases=new_biases)
 
 
 #### Miscellaneous functions
-def sigmoid(z):
+# every activation is made of numpy ufuncs and can work in place on ``out``
+def sigmoid(z, out=None):
     """ The sigmoid function """
-    return 1.0/(1.0+np.exp(-z))
+    if out is None:
+        return 1.0/(1.0+np.exp(-z))
+    np.negative(z, out=out)
+    np.exp(out, out=out)
+    out += 1.0
+    return np.reciprocal(out, out=out)
+
+def tanh(z, out=None):
+    """ The hyperbolic tangent function """
+    return np.tanh(z, out=out)
+
+def relu(z, out=None):
+    """ The rectified linear function """
+    return np.maximum(z, 0, out=out)
+
+ACTIVATIONS = {"sigmoid": sigmoid, "tanh": tanh, "relu": relu}
+
+# the derivative of each activation, written in terms of the activation's output
+def sigmoid_prime(a):
+    return a * (1 - a)
+
+def tanh_prime(a):
+    return 1 - a * a
+
+def relu_prime(a):
+    return (a > 0).astype(a.dtype)
+
+ACTIVATION_PRIMES = {"sigmoid": sigmoid_prime, "tanh": tanh_prime, "relu": relu_prime}
 
-sigmoid_vec = np.vectorize(sigmoid)
+sigmoid_vec = sigmoid # sigmoid already works on whole arrays
@@ -0,0 +1,212 @@
+""" opponents.py
+~~~~~~~~~~~~~~~~
+Scripted opponents for measuring fitness. Each one is a ``batchGame`` move
+function: it gets an (N, 9) array of boards from its own point of view and
+returns N moves, so a whole batch of games takes a handful of array
+operations. They all look squares up in the same tables, indexed by the
+perfectPlay board key: the squares that complete a line for the mover and
+for the opponent, and the minimax tables built from them.
+
+    random              any open square
+    win_block           win if possible, otherwise block, otherwise random
+                        (the batched ``RandomPlayer``)
+    center_corner       win, block, otherwise the center, a corner, an edge
+    minimax:<depth>     a random one of the best moves looking <depth> (0-9) plies
+                        ahead, minimax:9 plays perfectly
+    epsilon_perfect:<e> a random move with chance <e> (0-1), otherwise perfect
+
+A mix of them is written as "name[:param][=weight]" separated by commas, for
+example "win_block=0.5,minimax:2=0.3,epsilon_perfect:0.1=0.2", and
+``evaluate_mix`` splits a network's games between them by weight.
+
+"""
+
+import numpy as np
+
+from batchGame import BatchGame, EMPTY, population_player_moves, random_player_moves
+from perfectPlay import NUM_KEYS, POWERS, FIRST_SQUARE, LAST_SQUARE, board_keys, get_table
+
+SQUARE_BITS = 1 << np.arange(9)
+CENTER = 4
+CORNERS = 0b101000101
+PERFECT_DEPTH = 9
+DEFAULT_MIX = (("win_block", 1.0),) # what fitness was always measured against
+
+_minimax_tables = {}
+
+
+#### Picking squares out of bitmasks
+def open_masks(boards):
+    """Return the bitmask of open squares of each board"""
+    return np.dot(boards == EMPTY, SQUARE_BITS)
+
+
+def random_squares(masks, rng):
+    """Return a square picked uniformly out of each bitmask (0 for empty masks)"""
+    bits = (masks[:, np.newaxis] & SQUARE_BITS) != 0
+    k = (rng.random(len(masks)) * bits.sum(axis=1)).astype(int)
+    return np.argmax(bits.cumsum(axis=1) > k[:, np.newaxis], axis=1)
+
+
+#### Minimax
+def minimax_table(depth):
+    """Return the best-move bitmask of every board key for the player to
+    move when looking ``depth`` plies ahead. Keys are seen from the mover's
+    side (they are 1, the opponent 2), so the table works for X and O alike.
+    A win is worth 1, a loss -1 and anything not decided within ``depth``
+    plies 0. Built once per depth for all 3^9 keys at the same time.
+    """
+    if depth in _minimax_tables:
+        return _minimax_tables[depth]
+    if not 0 <= depth <= PERFECT_DEPTH:
+        raise ValueError("depth must be from 0 to %i, deeper looks no further than %i" % (PERFECT_DEPTH, PERFECT_DEPTH))
+    table = get_table()
+    keys = np.arange(NUM_KEYS)
+    digits = (keys[:, np.newaxis] // POWERS) % 3
+    flipped = np.dot((3 - digits) % 3, POWERS) # the same board seen from the other side
+    open_squares = digits == 0
+    wins = (table["x_wins"][:, np.newaxis] & SQUARE_BITS) != 0
+    fills_board = (open_squares.sum(axis=1) == 1)[:, np.newaxis]
+    # the key the opponent sees after each move, squares that are taken point anywhere valid
+    replies = flipped[np.where(open_squares, keys[:, np.newaxis] + POWERS, 0)]
+
+    value = np.zeros(NUM_KEYS, dtype=np.int8)
+    for ply in range(depth):
+        move_values = np.where(wins, 1, np.where(fills_board, 0, -value[replies]))
+        move_values = np.where(open_squares, move_values, -2)
+        value = move_values.max(axis=1).astype(np.int8)
+    best = open_squares & (move_values == value[:, np.newaxis]) if depth else open_squares
+    _minimax_tables[depth] = np.dot(best, SQUARE_BITS).astype(np.uint16)
+    return _minimax_tables[depth]
+
+
+#### Opponents, each returns a move function
+def random_moves(rng):
+    def get_moves(boards):
+        return random_squares(open_masks(boards), rng)
+    return get_moves
+
+
+def win_block_moves(rng):
+    def get_moves(boards):
+        return random_player_moves(boards, rng)
+    return get_moves
+
+
+def center_corner_moves(rng):
+    def get_moves(boards):
+        table = get_table()[board_keys(boards)]
+        wins, blocks = table["x_wins"], table["o_wins"]
+        masks = open_masks(boards)
+        corners = masks & CORNERS
+        moves = random_squares(np.where(corners != 0, corners, masks), rng)
+        moves = np.where(masks >> CENTER & 1, CENTER, moves)
+        moves = np.where(blocks != 0, LAST_SQUARE[blocks], moves)
+        return np.where(wins != 0, FIRST_SQUARE[wins], moves)
+    return get_moves
+
+
+def minimax_moves(rng, depth=2):
+    table = minimax_table(int(depth))
+    def get_moves(boards):
+        return random_squares(table[board_keys(boards)], rng)
+    return get_moves
+
+
+def epsilon_perfect_moves(rng, epsilon=0.1):
+    table = minimax_table(PERFECT_DEPTH)
+    epsilon = float(epsilon)
+    def get_moves(boards):
+        masks = table[board_keys(boards)]
+        masks = np.where(rng.random(len(boards)) < epsilon, open_masks(boards), masks)
+        return random_squares(masks, rng)
+    return get_moves
+
+
+OPPONENTS = {"random": random_moves, "win_block": win_block_moves, "center_corner": center_corner_moves,
+             "minimax": minimax_moves, "epsilon_perfect": epsilon_perfect_moves}
+WITH_PARAMETER = ("minimax", "epsilon_perfect") # the opponents that take a ":<param>"
+
+
+def make_opponent(name, rng):
+    """Return the move function for ``name`` ("minimax:3", "random", ...)"""
+    name, _, param = name.partition(":")
+    if name not in OPPONENTS:
+        raise ValueError("opponent must be one of %s" % sorted(OPPONENTS))
+    if param and name not in WITH_PARAMETER:
+        raise ValueError("%s does not take a parameter, only %s do" % (name, " and ".join(WITH_PARAMETER)))
+    if not param:
+        return OPPONENTS[name](rng)
+    if name == "minimax":
+        try:
+            depth = int(param)
+        except ValueError:
+            depth = -1
+        if not 0 <= depth <= PERFECT_DEPTH:
+            raise ValueError("the minimax depth must be a whole number from 0 to %i, not %s" % (PERFECT_DEPTH, param))
+        return minimax_moves(rng, depth)
+    try:
+        epsilon = float(param)
+    except ValueError:
+        epsilon = -1.0
+    if not 0 <= epsilon <= 1:
+        raise ValueError("the epsilon_perfect chance must be a number from 0 to 1, not %s" % param)
+    return epsilon_perfect_moves(rng, epsilon)
+
+
+def parse_mix(text):
+    """Return a mix as a tuple of (opponent, weight) from "name[:param][=weight],..." """
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.strip().partition("=")
+        make_opponent(name, None) # fail early on unknown names
+        weight = float(weight) if weight else 1.0
+        if not 0 < weight < float("inf"):
+            raise ValueError("the weight of %s must be a number more than 0" % name)
+        mix.append((name, weight))
+    return tuple(mix)
+
+
+def split_games(mix, num_games):
+    """Return how many of ``num_games`` each opponent of ``mix`` gets, in
+    proportion to the weights (largest remainders get the leftover games)"""
+    weights = np.array([w for _, w in mix], dtype=float)
+    if not len(weights) or not ((weights > 0) & np.isfinite(weights)).all():
+        raise ValueError("every opponent of a mix needs a weight that is a number more than 0")
+    shares = num_games * weights / weights.sum()
+    games = np.floor(shares).astype(int)
+    leftover = num_games - games.sum()
+    games[np.argsort(games - shares, kind="stable")[:leftover]] += 1
+    return games
+
+
+#### Fitness
+def evaluate_mix(weights, num_games, seed, activation="sigmoid", mix=DEFAULT_MIX):
+    """Play every stacked network ``num_games`` times as X and as O against
+    the opponents of ``mix``, split by weight. Runs in the worker processes,
+    so it only takes and returns plain values.
+
+    Returns:
+        tuple: arrays of (wins, losses, ties), one entry per network.
+    """
+    rng = np.random.default_rng(seed)
+    num_networks = len(weights[0])
+    wins = np.zeros(num_networks, dtype=np.int64)
+    losses = np.zeros(num_networks, dtype=np.int64)
+    ties = np.zeros(num_networks, dtype=np.int64)
+    for (name, _), games in zip(mix, split_games(mix, num_games)):
+        if games == 0:
+            continue
+        get_moves = population_player_moves(weights, games, activation)
+        get_opponent_moves = make_opponent(name, rng)
+
+        game = BatchGame(num_networks * games)
+        game.play_games(get_moves, get_opponent_moves)
+        x_wins, o_wins, x_ties = game.results(games)
+        game = BatchGame(num_networks * games)
+        game.play_games(get_opponent_moves, get_moves)
+        x_losses, o_losses, o_ties = game.results(games)
+        wins += x_wins + o_losses
+        losses += o_wins + x_losses
+        ties += x_ties + o_ties
+    return wins, losses, ties
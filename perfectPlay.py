@@ -0,0 +1,166 @@
+""" perfectPlay.py
+~~~~~~~~~~~~~~~~~~
+Solves tic tac toe. There are only 5,478 positions that can come up in a real
+game, so every one of them is worked out once and stored in a table indexed by
+a base-3 encoding of the board (0 for open, 1 for X, 2 for O, square 0 is the
+lowest digit). Each entry holds:
+
+    reachable   True for the 5,478 positions that can come up in a game
+    value       1, 0 or -1 if the player to move wins, draws or loses with
+                perfect play (reachable positions only)
+    best_moves  bitmask of the squares that keep that value
+    x_wins      bitmask of the open squares that complete a line for X
+    o_wins      bitmask of the open squares that complete a line for O
+
+The win squares only depend on what is on the board, so they are filled in for
+all 3^9 keys. That means a board seen from a player's point of view (1 for
+themselves, 2 for the opponent) can be looked up as well.
+
+The table is built the first time it is needed and cached to disk.
+
+"""
+
+import os
+
+import numpy as np
+
+# every way to win, as indexes into the board
+WIN_LINES = np.array([[0, 1, 2], [3, 4, 5], [6, 7, 8], # across
+                      [0, 3, 6], [1, 4, 7], [2, 5, 8], # down
+                      [0, 4, 8], [2, 4, 6]])           # diagonals
+
+NUM_KEYS = 3 ** 9
+POWERS = 3 ** np.arange(9)
+TABLE_DTYPE = np.dtype([("reachable", bool), ("value", np.int8), ("best_moves", np.uint16),
+                        ("x_wins", np.uint16), ("o_wins", np.uint16)])
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perfect_play_table.npy")
+
+# index of the first and last set bit of every 9 bit mask (0 for an empty mask)
+FIRST_SQUARE = np.array([(m & -m).bit_length() - 1 if m else 0 for m in range(512)])
+LAST_SQUARE = np.array([m.bit_length() - 1 if m else 0 for m in range(512)])
+
+# the base-3 key of a board that only has X on the squares of each 9 bit mask
+_BITS_TO_KEY = tuple(sum(3 ** i for i in range(9) if m >> i & 1) for m in range(512))
+
+_table = None
+
+
+#### Looking things up
+def get_table():
+    """Return the table, loading it from disk or building it on first use"""
+    global _table
+    if _table is None:
+        try:
+            _table = np.load(TABLE_FILE)
+        except (IOError, OSError, ValueError, EOFError):
+            _table = None
+        if _table is None or _table.dtype != TABLE_DTYPE or _table.shape != (NUM_KEYS,):
+            _table = build_table()
+            save_table(_table)
+    return _table
+
+
+def save_table(table):
+    """Write ``table`` to ``TABLE_FILE`` through a temporary file, so other
+    processes never load a half written one"""
+    tmp = "%s.%i.tmp" % (TABLE_FILE, os.getpid())
+    try:
+        with open(tmp, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp, TABLE_FILE)
+    except (IOError, OSError):
+        # the cache is only an optimization
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def board_key(board):
+    """Return the key of a ``Game.board`` style list of "X", "O" and "" """
+    key = 0
+    for i in range(8, -1, -1):
+        key = key * 3 + ("", "X", "O").index(board[i])
+    return key
+
+
+def board_keys(boards):
+    """Return the keys of an (N, 9) array of boards that use 1, -1 and 0 like
+    ``batchGame``. Boards seen from a player's point of view get keys where
+    that player is X."""
+    return np.dot(boards % 3, POWERS)
+
+
+def bits_key(x_bits, o_bits):
+    """Return the key of a board given as one 9 bit mask per player"""
+    return _BITS_TO_KEY[x_bits] + 2 * _BITS_TO_KEY[o_bits]
+
+
+def squares(mask):
+    """Return the list of squares set in a bitmask"""
+    return [i for i in range(9) if mask >> i & 1]
+
+
+def value(key):
+    """Return 1, 0 or -1 if the player to move wins, draws or loses with perfect play"""
+    return int(get_table()["value"][key])
+
+
+def best_moves(key):
+    """Return every square that is a perfect move"""
+    return squares(int(get_table()["best_moves"][key]))
+
+
+def winning_squares(key, letter):
+    """Return the bitmask of open squares that would win the game for ``letter``"""
+    return int(get_table()["x_wins" if letter == "X" else "o_wins"][key])
+
+
+#### Building the table
+def build_table():
+    """Work out every entry of the table. Returns a structured array with
+    one ``TABLE_DTYPE`` record per key."""
+    table = np.zeros(NUM_KEYS, dtype=TABLE_DTYPE)
+    digits = (np.arange(NUM_KEYS)[:, np.newaxis] // POWERS) % 3
+
+    # an open square wins for a player when the other two squares of a line are theirs
+    for line in WIN_LINES:
+        for c in range(3):
+            a, b = [line[o] for o in range(3) if o != c]
+            open_square = digits[:, line[c]] == 0
+            for field, p in (("x_wins", 1), ("o_wins", 2)):
+                hit = open_square & (digits[:, a] == p) & (digits[:, b] == p)
+                table[field][hit] |= 1 << int(line[c])
+
+    # negamax over the game tree, every position is only solved once
+    lines = [tuple(line) for line in WIN_LINES.tolist()]
+
+    def solve(board, player, key):
+        if table["reachable"][key]:
+            return table["value"][key]
+        table["reachable"][key] = True
+
+        other = 3 - player
+        # the player that just moved is the only one that can have won
+        if any(board[a] == other and board[b] == other and board[c] == other for a, b, c in lines):
+            table["value"][key] = -1
+            return -1
+        if 0 not in board:
+            return 0 # cats game, value is already 0
+
+        best, moves = -2, 0
+        for i in range(9):
+            if board[i] == 0:
+                board[i] = player
+                v = -solve(board, other, key + player * POWERS[i])
+                board[i] = 0
+                if v > best:
+                    best, moves = v, 1 << i
+                elif v == best:
+                    moves |= 1 << i
+        table["value"][key] = best
+        table["best_moves"][key] = moves
+        return best
+
+    solve([0] * 9, 1, 0)
+    return table
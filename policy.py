@@ -0,0 +1,142 @@
+""" policy.py
+~~~~~~~~~~~~~
+Freezes a trained ``Network`` into a small file that is all a player needs,
+so playing or serving the best network does not load a population. A policy
+file is a short header followed by one flat array:
+
+    magic       8 bytes, b"PYTTTPOL"
+    version     uint32, ``FORMAT_VERSION``
+    length      uint32, bytes of the JSON header that follows
+    header      JSON: kind, sizes, activation, dtype, count
+    padding     up to a multiple of ``ALIGNMENT`` bytes
+    data        ``count`` items of ``dtype``
+
+There are two kinds:
+
+    table       the move the network makes on every one of the 3^9 boards
+                (seen from the mover's side, indexed like perfectPlay's
+                keys), 19683 bytes and no network to run at all
+    weights     every weight and bias as float32 (see ``network.flatten``), for
+                networks that should keep running as networks
+
+``load_policy`` memory-maps the data and returns a player that can be used
+anywhere a ``NeuralnetPlayer`` can. Nothing here imports geneticAlgorithm.
+
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from batchGame import best_legal_moves, network_player_moves
+from game import CLASSIC, NeuralnetPlayer, Player
+from network import Network, flatten, num_params, unflatten
+from perfectPlay import NUM_KEYS, POWERS, bits_key, board_keys
+
+MAGIC = b"PYTTTPOL"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+KINDS = ("table", "weights")
+NO_MOVE = 255 # the table entry for full boards
+
+
+#### Exporting
+def move_table(net):
+    """Return the move ``net`` makes on every board key as a uint8 array"""
+    digits = (np.arange(NUM_KEYS)[:, np.newaxis] // POWERS) % 3
+    boards = np.where(digits == 2, -1, digits).astype(np.int8)
+    moves = best_legal_moves(net.feedforward(boards.T).T, boards).astype(np.uint8)
+    moves[(boards != 0).all(axis=1)] = NO_MOVE
+    return moves
+
+
+def export_policy(net, filename, kind="table"):
+    """Write ``net`` to the policy file ``filename`` as one of ``KINDS``"""
+    if kind not in KINDS:
+        raise ValueError("kind must be one of %s" % (KINDS,))
+    if kind == "table":
+        if net.sizes[0] != 9 or net.sizes[-1] != 9:
+            raise ValueError("a move table needs a network with 9 inputs and 9 outputs")
+        data = move_table(net)
+    else:
+        data = flatten(net, np.float32)
+
+    header = json.dumps({"kind": kind, "sizes": list(net.sizes), "activation": net.activation,
+                         "dtype": data.dtype.name, "count": len(data)}).encode("utf-8")
+    start = struct.pack("<8sII", MAGIC, FORMAT_VERSION, len(header)) + header
+    start += b"\0" * (-len(start) % ALIGNMENT)
+
+    tmp = filename + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(start)
+        f.write(data.tobytes())
+    os.replace(tmp, filename)
+
+
+#### Loading
+def read_header(filename):
+    """Return the JSON header of a policy file and the offset of its data
+
+    Raises:
+        ValueError: if the file is not a policy file or is from a newer version.
+    """
+    with open(filename, "rb") as f:
+        magic, version, length = struct.unpack("<8sII", f.read(16))
+        if magic != MAGIC:
+            raise ValueError("%s is not a policy file" % filename)
+        if version > FORMAT_VERSION:
+            raise ValueError("%s has policy format %i, this version reads up to %i"
+                             % (filename, version, FORMAT_VERSION))
+        header = json.loads(f.read(length).decode("utf-8"))
+    offset = 16 + length
+    return header, offset + (-offset % ALIGNMENT)
+
+
+def load_policy(filename, mmap=True):
+    """Return a player for the policy file ``filename``: a ``TablePlayer``
+    for move tables and a ``NeuralnetPlayer`` for weights. With ``mmap`` the
+    data is memory-mapped instead of read."""
+    header, offset = read_header(filename)
+    dtype, count = np.dtype(header["dtype"]), header["count"]
+    if mmap:
+        data = np.asarray(np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=(count,)))
+    else:
+        data = np.fromfile(filename, dtype=dtype, count=count, offset=offset)
+
+    if header["kind"] == "table":
+        return TablePlayer(data, header["sizes"], header["activation"])
+    sizes = header["sizes"]
+    if count not in (num_params(sizes), num_params(sizes, biases=False)):
+        raise ValueError("%s has %i parameters, sizes %s need %i (or %i without biases)"
+                         % (filename, count, sizes, num_params(sizes), num_params(sizes, biases=False)))
+    weights, biases = unflatten(data, sizes)
+    return NeuralnetPlayer(Network(sizes, weights, header["activation"], biases=biases))
+
+
+def policy_moves(player):
+    """Return a ``batchGame`` move function for a player from ``load_policy``"""
+    if isinstance(player, TablePlayer):
+        return player.get_moves
+    return network_player_moves(player.network)
+
+
+### TablePlayer - a frozen network, one lookup per move
+class TablePlayer(Player):
+    """Makes the moves a network made when its table was exported. Only
+    knows 3x3 tic tac toe."""
+
+    def __init__(self, table, sizes=None, activation=None):
+        self.table = table
+        self.sizes = sizes # of the network the table came from
+        self.activation = activation
+
+    def get_move(self, game):
+        if game.layout is not CLASSIC:
+            raise ValueError("a move table only knows 3x3 tic tac toe")
+        return int(self.table[bits_key(*game.masks(self.player_letter))])
+
+    def get_moves(self, boards):
+        """The move for each of an (N, 9) array of boards seen from the mover's side"""
+        return self.table[board_keys(boards)]
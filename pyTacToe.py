@@ -1,8 +1,29 @@
-from game import *
-from network import Network
-from geneticAlgorithm import Population
-from geneticAlgorithm import load_population_from_file
-import os.path
+""" pyTacToe.py
+~~~~~~~~~~~~~~
+Command line entry point. With no command it starts the interactive menu,
+otherwise:
+
+    $ python pyTacToe.py train --generations 500 --workers 8 --seed 1
+    $ python pyTacToe.py train --time-budget 3600 --checkpoint runs/big --pop-size 2000
+    $ python pyTacToe.py islands --islands 4 --generations 100 --migration-interval 5
+    $ python pyTacToe.py eval --games 1000
+    $ python pyTacToe.py play --first
+    $ python pyTacToe.py fit --epochs 200 --output best.policy
+    $ python pyTacToe.py export --output best.policy
+    $ python pyTacToe.py play --policy best.policy
+    $ python pyTacToe.py serve --port 8765
+    $ python pyTacToe.py connect --simulate 200
+    $ python pyTacToe.py bench --quick
+
+Nothing heavy (NumPy, populations) is imported or created until a command
+needs it, so importing this module has no side effects.
+
+"""
+
+import argparse
+import os
+import sys
+import time
 
 # Shim to make sure input works in python v 2 and 3
 try:
@@ -11,65 +32,413 @@ except NameError:
     pass
 # end python v 2 and 3 input shim
 
-def create_population():
-    return Population(200, 0.1, [9, 18, 12, 9])
+# number of processes used to measure fitness while training
+NUM_WORKERS = os.cpu_count() or 1
+CHECKPOINT_PATH = "saved_population"
+LEGACY_SAVE_FILE = "saved_population.p"
 
-print("Welcome to pyTacToe. Learning Python and machine learning via TicTacToe.")
-print("")
+def create_population(pop_size=200, carry_over_pct=0.1, net_sizes=(9, 18, 12, 9), workers=None, seed=None):
+    from geneticAlgorithm import Population
+    return Population(pop_size, carry_over_pct, list(net_sizes),
+                      workers=NUM_WORKERS if workers is None else workers, seed=seed)
 
-if os.path.isfile("saved_population.p"):
-    # load population from file if it exists
-    pop = load_population_from_file("saved_population.p")
-    print("[saved population autoloaded]")
-else:
-    # otherwise create a new one
-    pop = create_population()
-    print("[new population created]")
+def load_population(path=CHECKPOINT_PATH):
+    """Return the population saved at ``path`` (or in the old pickle file) or None"""
+    from checkpoint import is_checkpoint
+    from geneticAlgorithm import load_population_from_checkpoint, load_population_from_file
+    if is_checkpoint(path):
+        return load_population_from_checkpoint(path)
+    if path == CHECKPOINT_PATH and os.path.isfile(LEGACY_SAVE_FILE):
+        # saved by an older version
+        return load_population_from_file(LEGACY_SAVE_FILE)
+    return None
 
-print("Population size: %i" % pop.pop_size)
-print("Current generation: %i" % pop.generation)
-print("Network sizes: %s" % pop.pool[0].net.sizes)
-print("Survivors each gen: %i" % pop.carry_over_size)
+def play_against(player, human_first):
+    from game import Game, HumanPlayer
+    if human_first:
+        game = Game(HumanPlayer(), player)
+    else:
+        game = Game(player, HumanPlayer())
+    game.play_game()
 
-while True:
-    print("")
-    print("What do you want to do?")
-    print("    P: Play against the current best neural net")
-    print("    #: Train X number of epochs (enter an int)")
-    print("    D: Delete current population and start a new one")
-    print("    Q: Quit")
 
-    choice = input("Choice: ").lower()
+#### Commands
+def menu(args):
+    print("Welcome to pyTacToe. Learning Python and machine learning via TicTacToe.")
     print("")
 
-    if choice[0] == "q":
-        break # quit
+    pop = load_population()
+    if pop is not None:
+        pop.workers = NUM_WORKERS
+        print("[saved population autoloaded]")
+    else:
+        # otherwise create a new one
+        pop = create_population()
+        print("[new population created]")
+
+    print("Population size: %i" % pop.pop_size)
+    print("Current generation: %i" % pop.generation)
+    print("Network sizes: %s" % pop.pool[0].net.sizes)
+    print("Survivors each gen: %i" % pop.carry_over_size)
 
-    elif choice[0] == "d":
-        yn = input("Are you sure? (enter a full YES) ").lower()
-        if yn == "yes":
-            pop = create_population()
-            print("[new population created]")
-        else:
-            print("[Aborted]")
+    while True:
+        print("")
+        print("What do you want to do?")
+        print("    P: Play against the current best neural net")
+        print("    #: Train X number of epochs (enter an int)")
+        print("    D: Delete current population and start a new one")
+        print("    Q: Quit")
+
+        choice = input("Choice: ").lower()
+        print("")
+
+        if choice[0] == "q":
+            pop.close()
+            break # quit
 
-    elif choice[0] == "p":
-        # play against the current best
-        best_player = pop.pool[0].player
+        elif choice[0] == "d":
+            yn = input("Are you sure? (enter a full YES) ").lower()
+            if yn == "yes":
+                pop.close()
+                pop = create_population()
+                print("[new population created]")
+            else:
+                print("[Aborted]")
+
+        elif choice[0] == "p":
+            # play against the current best
+            yn = input("Do you want to go first? ").lower()
+            play_against(pop.pool[0].player, yn[0] == "y")
 
-        yn = input("Do you want to go first? ").lower()
-        if yn[0] == "y":
-            game = Game(HumanPlayer(), best_player)
         else:
-            game = Game(best_player, HumanPlayer())
+            # Train for X epochs
+            try:
+                for epoch in range(int(choice)):
+                    pop.advance_one_generation()
+            except ValueError:
+                print("Invalid choice, try again.")
+                continue
 
-        game.play_game()
 
-    else:
-        # Train for X epochs
+def train(args):
+    if args.generations is None and args.time_budget is None:
+        sys.exit("train needs --generations and/or --time-budget")
+
+    pop = None if args.new else load_population(args.checkpoint)
+    if pop is None:
         try:
-            for epoch in range(int(choice)):
-                pop.advance_one_generation()
-        except ValueError:
-            print("Invalid choice, try again.")
-            continue
+            pop = create_population(200 if args.pop_size is None else args.pop_size,
+                                    0.1 if args.carry_over is None else args.carry_over,
+                                    [9, 18, 12, 9] if args.sizes is None else args.sizes, args.workers, args.seed)
+        except ValueError as e:
+            sys.exit(str(e))
+        print("[new population created]")
+    else:
+        if args.workers is not None:
+            pop.workers = args.workers
+        print("[population loaded at generation %i]" % pop.generation)
+        warn_ignored_settings(args, pop)
+    pop.checkpoint_path = args.checkpoint
+    pop.checkpoint_interval = args.checkpoint_interval
+    pop.show_progress = not args.quiet
+    if args.evaluation is not None:
+        pop.evaluation = args.evaluation
+    if args.opponents is not None:
+        pop.opponents = args.opponents
+    if args.fitness_cache:
+        from cache import FitnessCache
+        pop.fitness_cache = FitnessCache(args.fitness_cache, args.accumulate_fitness)
+    if args.gradient_epochs:
+        from gradient import GradientTrainer
+        pop.trainer = GradientTrainer(epochs=args.gradient_epochs)
+    if args.metrics or args.profile_generations:
+        from metrics import MetricsStream
+        pop.metrics = MetricsStream(args.metrics, args.profile_generations, args.profile_file)
+
+    start = time.time()
+    generations = 0
+    try:
+        while args.generations is None or generations < args.generations:
+            if args.time_budget is not None and time.time() - start >= args.time_budget:
+                break
+            pop.advance_one_generation()
+            generations += 1
+    finally:
+        # always leave a checkpoint of the last finished generation behind
+        pop.save_checkpoint(pop.checkpoint_path)
+        pop.close()
+        if pop.metrics is not None:
+            pop.metrics.close()
+    print("[trained %i generations in %.1f seconds, now at generation %i]"
+          % (generations, time.time() - start, pop.generation))
+
+
+def islands(args):
+    from islands import run_islands
+    settings = {}
+    if args.evaluation is not None:
+        settings["evaluation"] = args.evaluation
+    if args.opponents is not None:
+        settings["opponents"] = args.opponents
+
+    start = time.time()
+    try:
+        net, best = run_islands(args.islands, args.generations, args.pop_size, args.carry_over, args.sizes,
+                                seed=args.seed, migration_interval=args.migration_interval, migrants=args.migrants,
+                                checkpoint=args.checkpoint, new=args.new, settings=settings,
+                                show_progress=not args.quiet)
+    except ValueError as e:
+        sys.exit(str(e))
+    print("[%i islands trained %i generations in %.1f seconds, global best from island %i at generation %i:"
+          " %i wins, %i losses, %i ties]" % (args.islands, args.generations, time.time() - start, best["island"],
+                                             best["at_generation"], best["wins"], best["losses"], best["ties"]))
+    if args.output:
+        from policy import export_policy
+        export_policy(net, args.output, args.kind)
+        print("[global best exported to %s]" % args.output)
+
+
+def warn_ignored_settings(args, pop):
+    """Say which of the settings for a new population differ from the one
+    ``train`` resumed, they only apply with --new"""
+    ignored = []
+    if args.pop_size is not None and args.pop_size != pop.pop_size:
+        ignored.append("--pop-size %i (it has %i)" % (args.pop_size, pop.pop_size))
+    if args.sizes is not None and list(args.sizes) != list(pop.pool[0].net.sizes):
+        ignored.append("--sizes %s (it has %s)" % (",".join(map(str, args.sizes)),
+                                                   ",".join(map(str, pop.pool[0].net.sizes))))
+    if args.carry_over is not None and int(pop.pop_size * args.carry_over) != pop.carry_over_size:
+        ignored.append("--carry-over %g (it keeps %i of %i)" % (args.carry_over, pop.carry_over_size, pop.pop_size))
+    if args.seed is not None and args.seed != pop.seed:
+        ignored.append("--seed %i (it has %s)" % (args.seed, pop.seed))
+    for setting in ignored:
+        print("[warning: %s is ignored for the population resumed from %s, use --new to start a new one]"
+              % (setting, args.checkpoint))
+
+
+def evaluate(args):
+    from game import Game, NeuralnetPlayer, PerfectPlayer
+    from geneticAlgorithm import Individual
+    from network import stack_weights
+    from opponents import evaluate_mix
+    from symmetry import MoveCache
+
+    pop = load_population(args.checkpoint)
+    if pop is None:
+        sys.exit("no saved population at %s" % args.checkpoint)
+    best = pop.pool[0].net
+
+    wins, losses, ties = evaluate_mix(stack_weights([best]), args.games, args.seed, best.activation)
+    print("vs random:  %i wins, %i losses, %i ties" % (wins[0], losses[0], ties[0]))
+
+    import numpy as np
+    individual = Individual(pop.pool[0].generation, best)
+    # one player for every game, so its cache only runs the network once per board
+    player = NeuralnetPlayer(best, individual, MoveCache())
+    perfect = PerfectPlayer(np.random.default_rng(args.seed))
+    for _ in range(args.games):
+        Game(player, perfect).play_game()
+        Game(perfect, player).play_game()
+    print("vs perfect: %i wins, %i losses, %i ties" % (individual.wins, individual.losses, individual.ties))
+
+
+def play(args):
+    if args.policy:
+        from policy import load_policy
+        play_against(load_policy(args.policy), args.first)
+        return
+    pop = load_population(args.checkpoint)
+    if pop is None:
+        sys.exit("no saved population at %s" % args.checkpoint)
+    play_against(pop.pool[0].player, args.first)
+
+
+def fit(args):
+    import numpy as np
+    from exhaustive import evaluate_network
+    from gradient import GradientTrainer, accuracy
+    from network import Network
+    from policy import export_policy
+
+    rng = np.random.default_rng(args.seed)
+    net = Network(args.sizes, rng=rng)
+    trainer = GradientTrainer(args.epochs, args.batch_size, args.eta, args.lmbda)
+    start = time.time()
+    trainer.train(net, rng)
+    print("[trained %i epochs in %.1f seconds, perfect moves on %.1f%% of positions]"
+          % (args.epochs, time.time() - start, 100 * accuracy(net)))
+    wins, losses, ties = evaluate_network(net)
+    print("vs every opponent line: %i wins, %i losses, %i ties" % (wins, losses, ties))
+    export_policy(net, args.output, args.kind)
+    print("[exported to %s]" % args.output)
+
+
+def export(args):
+    from policy import export_policy
+    pop = load_population(args.checkpoint)
+    if pop is None:
+        sys.exit("no saved population at %s" % args.checkpoint)
+    export_policy(pop.pool[0].net, args.output, args.kind)
+    print("[best network of generation %i exported to %s, %i bytes]"
+          % (pop.generation, args.output, os.path.getsize(args.output)))
+
+
+def serve(args):
+    import server
+    if args.policy:
+        from policy import load_policy, policy_moves
+        bots = dict((os.path.splitext(os.path.basename(f))[0], policy_moves(load_policy(f)))
+                    for f in args.policy)
+        bots.update(server.make_bots({}))
+    else:
+        pop = load_population(args.checkpoint)
+        if pop is None:
+            sys.exit("no saved population at %s" % args.checkpoint)
+        bots = server.make_bots(dict(("best" if rank == 0 else "rank%i" % (rank + 1), i.net)
+                                     for rank, i in enumerate(pop.pool[:args.top])))
+    server.serve(bots, args.host, args.port, args.max_batch, args.max_delay)
+
+
+def connect(args):
+    import client
+    client.main(args.host, args.port, "O" if args.second else "X", args.bot,
+                args.simulate, args.games, args.seed)
+
+
+def bench(args):
+    import benchmark
+    benchmark.main(args.bench_args)
+
+
+def parse_sizes(text):
+    return [int(s) for s in text.split(",")]
+
+def parse_opponents(text):
+    from opponents import parse_mix
+    try:
+        return parse_mix(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tic tac toe and neural networks trained with a genetic algorithm")
+    commands = parser.add_subparsers(dest="command")
+
+    p = commands.add_parser("train", help="train without any prompts")
+    # None so a resumed population can tell which were asked for, see warn_ignored_settings
+    p.add_argument("--pop-size", type=int, default=None, help="individuals in a new population (default: 200)")
+    p.add_argument("--sizes", type=parse_sizes, default=None,
+                   help="network layer sizes of a new population, e.g. 9,18,12,9 (the default)")
+    p.add_argument("--carry-over", type=float, default=None,
+                   help="fraction of survivors each generation of a new population (default: 0.1)")
+    p.add_argument("--workers", type=int, default=None, help="processes used to measure fitness (default: all cores)")
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--generations", type=int, default=None, help="stop after this many generations")
+    p.add_argument("--time-budget", type=float, default=None, help="stop after this many seconds")
+    p.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="checkpoint directory to resume from and save to")
+    p.add_argument("--checkpoint-interval", type=int, default=1, help="generations between checkpoints")
+    p.add_argument("--new", action="store_true", help="start a new population even if a checkpoint exists")
+    p.add_argument("--metrics", help="append per generation metrics to this .jsonl or .csv file")
+    p.add_argument("--profile-generations", type=int, default=0,
+                   help="cProfile this many generations, with or without --metrics")
+    p.add_argument("--profile-file", default="training.prof", help="where the cProfile stats are written")
+    p.add_argument("--evaluation", choices=("sampled", "exhaustive", "adaptive"), default=None,
+                   help="games against the opponents, every opponent line, or rounds of games that stop"
+                        " for networks that can not survive (default: sampled)")
+    p.add_argument("--opponents", type=parse_opponents, default=None,
+                   help="opponents of the sampled games, e.g. win_block=0.5,minimax:2=0.3,epsilon_perfect:0.1=0.2")
+    p.add_argument("--fitness-cache", type=int, default=0,
+                   help="remember the fitness games of this many networks so survivors do not replay them")
+    p.add_argument("--accumulate-fitness", action="store_true",
+                   help="replay cached networks and add up their games instead of skipping them")
+    p.add_argument("--gradient-epochs", type=int, default=0,
+                   help="also train every new generation for this many backprop epochs on perfect play")
+    p.add_argument("--quiet", action="store_true", help="do not print fitness progress")
+    p.set_defaults(func=train)
+
+    p = commands.add_parser("islands", help="train several populations in parallel processes that trade their best")
+    p.add_argument("--islands", type=int, default=NUM_WORKERS, help="populations, one process each (default: all cores)")
+    p.add_argument("--generations", type=int, required=True, help="generations each island trains")
+    p.add_argument("--migration-interval", type=int, default=5, help="generations between migrations, 0 for never")
+    p.add_argument("--migrants", type=int, default=2, help="best networks each island sends to the next")
+    p.add_argument("--pop-size", type=int, default=200, help="individuals in each new island")
+    p.add_argument("--sizes", type=parse_sizes, default=[9, 18, 12, 9], help="network layer sizes, e.g. 9,18,12,9")
+    p.add_argument("--carry-over", type=float, default=0.1, help="fraction of survivors each generation")
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--checkpoint", default=CHECKPOINT_PATH,
+                   help="islands resume from and save to <checkpoint>-island-<n>")
+    p.add_argument("--new", action="store_true", help="start new islands even if checkpoints exist")
+    p.add_argument("--evaluation", choices=("sampled", "exhaustive", "adaptive"), default=None)
+    p.add_argument("--opponents", type=parse_opponents, default=None)
+    p.add_argument("--output", help="export the global best to this policy file")
+    p.add_argument("--kind", choices=("table", "weights"), default="table")
+    p.add_argument("--quiet", action="store_true", help="do not print island progress")
+    p.set_defaults(func=islands)
+
+    p = commands.add_parser("fit", help="train one network by backprop on perfect play and export it")
+    p.add_argument("--sizes", type=parse_sizes, default=[9, 64, 64, 9], help="network layer sizes")
+    p.add_argument("--epochs", type=int, default=200)
+    p.add_argument("--batch-size", type=int, default=16)
+    p.add_argument("--eta", type=float, default=0.5, help="learning rate")
+    p.add_argument("--lmbda", type=float, default=0.0, help="L2 regularization")
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--output", default="best.policy")
+    p.add_argument("--kind", choices=("table", "weights"), default="table")
+    p.set_defaults(func=fit)
+
+    p = commands.add_parser("eval", help="score the best network against the random and perfect players")
+    p.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    p.add_argument("--games", type=int, default=1000, help="games per side against each opponent")
+    p.add_argument("--seed", type=int, default=None)
+    p.set_defaults(func=evaluate)
+
+    p = commands.add_parser("play", help="play against the best network")
+    p.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    p.add_argument("--first", action="store_true", help="take X and move first")
+    p.add_argument("--policy", help="play a policy file from export instead of a checkpoint")
+    p.set_defaults(func=play)
+
+    p = commands.add_parser("export", help="freeze the best network into a small policy file")
+    p.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    p.add_argument("--output", default="best.policy")
+    p.add_argument("--kind", choices=("table", "weights"), default="table",
+                   help="a move for every board or the float32 weights (default: table)")
+    p.set_defaults(func=export)
+
+    p = commands.add_parser("serve", help="host games against the best networks over TCP")
+    p.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--top", type=int, default=1, help="serve this many of the best networks")
+    p.add_argument("--max-batch", type=int, default=256, help="most bot moves in one forward pass")
+    p.add_argument("--max-delay", type=float, default=0.002, help="seconds a bot move waits for others")
+    p.add_argument("--policy", nargs="+", help="serve policy files from export instead of a checkpoint")
+    p.set_defaults(func=serve)
+
+    p = commands.add_parser("connect", help="play on a server, or load it with simulated players")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--bot", default=None, help="opponent to ask the server for")
+    p.add_argument("--second", action="store_true", help="take O and let the bot go first")
+    p.add_argument("--simulate", type=int, default=0, help="play this many random sessions at once")
+    p.add_argument("--games", type=int, default=10, help="games per simulated session")
+    p.add_argument("--seed", type=int, default=None)
+    p.set_defaults(func=connect)
+
+    p = commands.add_parser("bench", help="run benchmark.py, remaining arguments go to it")
+    p.add_argument("bench_args", nargs=argparse.REMAINDER)
+    p.set_defaults(func=bench)
+
+    # options after bench (like --quick) are benchmark.py's, argparse would reject them
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "bench":
+        args.bench_args = extra + args.bench_args
+    elif extra:
+        parser.error("unrecognized arguments: %s" % " ".join(extra))
+    if args.command is None:
+        menu(args)
+    else:
+        args.func(args)
+
+if __name__ == "__main__":
+    main()
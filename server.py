@@ -0,0 +1,263 @@
+""" server.py
+~~~~~~~~~~~~~
+Hosts many games of tic tac toe against bots over TCP from a single process.
+Every connection is a session that can play any number of games, one at a
+time, with a plain line based protocol (run ``client.py`` to try it):
+
+    client                      server
+    ------                      ------
+                                HELLO pyTacToe <bot> <bot> ...
+    NEW [X|O] [bot]             start a game as X (the default, X moves
+                                first) or O against a bot (default the
+                                first one the server lists)
+    MOVE <1-9>                  put your letter on a square
+    BOARD                       the board again
+    STATS                       how much work the bots have done
+    QUIT                        close the connection
+
+                                BOARD <9 characters>  squares 1-9 as X, O or .
+                                BOT <1-9>             the bot's move
+                                TURN                  your move
+                                OVER X|O|TIE          the game is over
+                                STATS <key>=<value> ...
+                                ERR <message>
+
+Each bot (a loaded ``Network`` or the random player) is shared by every
+session. Sessions do not call it themselves, they queue the board they want
+a move for and a ``MoveBatcher`` answers everything that is waiting with one
+batched forward pass, as soon as ``max_batch`` boards are queued or
+``max_delay`` seconds after the first one.
+
+"""
+
+import asyncio
+
+import numpy as np
+
+from batchGame import network_player_moves, random_player_moves
+from game import Game, Player
+
+PROTOCOL = "pyTacToe"
+SQUARE_LETTERS = {"X": "X", "O": "O", "": "."}
+
+
+### MoveBatcher - collects boards from every session and answers them together
+class MoveBatcher(object):
+
+    def __init__(self, get_moves, max_batch=256, max_delay=0.002):
+        """Batch the move requests for one bot.
+
+        Args:
+            get_moves (callable): a ``batchGame`` move function, takes an
+                (N, 9) array of boards seen from the bot's side and returns
+                N moves.
+            max_batch (int): answer as soon as this many boards are waiting.
+            max_delay (float): the longest a board waits for others, in seconds.
+        """
+        self.get_moves = get_moves
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pending = []
+        self.timer = None
+        self.batches = 0
+        self.moves = 0
+
+    async def get_move(self, board):
+        """Return the bot's move for ``board`` (9 ints, 1 for the bot, -1
+        for the opponent and 0 for open squares)"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((board, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_delay, self.flush)
+        return await future
+
+    def flush(self):
+        """Answer every waiting board with one call to ``get_moves``"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        boards = np.array([board for board, _ in pending], dtype=np.int8)
+        try:
+            moves = self.get_moves(boards)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.moves += len(pending)
+        for (_, future), move in zip(pending, moves):
+            if not future.done(): # the session may have gone away
+                future.set_result(int(move))
+
+
+### GameServer
+class GameServer(object):
+
+    def __init__(self, bots, max_batch=256, max_delay=0.002):
+        """Serve games against ``bots``.
+
+        Args:
+            bots (dict): bot name -> ``batchGame`` move function. The first
+                one is the default opponent.
+            max_batch (int): see ``MoveBatcher``.
+            max_delay (float): see ``MoveBatcher``.
+        """
+        if not bots:
+            raise ValueError("the server needs at least one bot")
+        self.batchers = dict((name, MoveBatcher(get_moves, max_batch, max_delay))
+                             for name, get_moves in bots.items())
+        self.default_bot = next(iter(bots))
+        self.sessions = 0
+        self.games = 0
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_session, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def stats(self):
+        moves = sum(b.moves for b in self.batchers.values())
+        batches = sum(b.batches for b in self.batchers.values())
+        return "sessions=%i games=%i moves=%i batches=%i moves_per_batch=%.2f" % (
+            self.sessions, self.games, moves, batches, moves / batches if batches else 0.0)
+
+    async def handle_session(self, reader, writer):
+        def send(*lines):
+            writer.write("".join(line + "\n" for line in lines).encode())
+
+        self.sessions += 1
+        session = Session(self)
+        try:
+            send("HELLO %s %s" % (PROTOCOL, " ".join(self.batchers)))
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode(errors="replace").split()
+                if not words:
+                    continue
+                command = words[0].upper()
+                if command == "QUIT":
+                    break
+                try:
+                    send(*(await session.command(command, words[1:])))
+                except ValueError as e:
+                    send("ERR %s" % e)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+
+### Session - the state of one connection
+class Session(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.game = None
+        self.human = Player()
+        self.bot = Player()
+        self.batcher = None
+
+    async def command(self, command, args):
+        """Run one client command and return the lines to send back
+
+        Raises:
+            ValueError: the command is unknown or not allowed right now.
+        """
+        if command == "NEW":
+            return await self.new_game(args)
+        elif command == "MOVE":
+            return await self.move(args)
+        elif command == "BOARD":
+            if self.game is None:
+                raise ValueError("no game, send NEW")
+            return [self.board_line()]
+        elif command == "STATS":
+            return ["STATS " + self.server.stats()]
+        raise ValueError("unknown command %s" % command)
+
+    async def new_game(self, args):
+        letter = args[0].upper() if args else "X"
+        if letter not in ("X", "O"):
+            raise ValueError("play X or O")
+        name = args[1] if len(args) > 1 else self.server.default_bot
+        if name not in self.server.batchers:
+            raise ValueError("no bot called %s" % name)
+
+        self.batcher = self.server.batchers[name]
+        self.human.player_letter = letter
+        self.bot.player_letter = "O" if letter == "X" else "X"
+        self.server.games += 1
+        if letter == "X":
+            self.game = Game(self.human, self.bot)
+            return [self.board_line(), "TURN"]
+        self.game = Game(self.bot, self.human)
+        return await self.bot_move()
+
+    async def move(self, args):
+        game = self.game
+        if game is None or game.is_game_over:
+            raise ValueError("no game, send NEW")
+        try:
+            move = int(args[0]) - 1
+        except (IndexError, ValueError):
+            raise ValueError("MOVE needs a square, 1-9")
+        if not 0 <= move < game.size:
+            raise ValueError("that move is not on the board")
+        if not game.is_open(move):
+            raise ValueError("that square is taken")
+
+        game.make_move(move)
+        if game.is_game_over:
+            return [self.board_line(), self.over_line()]
+        return await self.bot_move()
+
+    async def bot_move(self):
+        game = self.game
+        own, opponent = game.masks(self.bot.player_letter)
+        board = [(own >> i & 1) - (opponent >> i & 1) for i in range(game.size)]
+        move = await self.batcher.get_move(board)
+        game.make_move(move)
+        lines = ["BOT %i" % (move + 1), self.board_line()]
+        if game.is_game_over:
+            lines.append(self.over_line())
+        else:
+            lines.append("TURN")
+        return lines
+
+    def board_line(self):
+        return "BOARD " + "".join(SQUARE_LETTERS[s] for s in self.game.board)
+
+    def over_line(self):
+        if self.game.winner is None:
+            return "OVER TIE"
+        return "OVER %s" % self.game.winner.player_letter
+
+
+def make_bots(networks, seed=None):
+    """Return bot move functions for ``networks`` (name -> ``Network``) and
+    the random player, which is called "random"."""
+    bots = dict((name, network_player_moves(net)) for name, net in networks.items())
+    rng = np.random.default_rng(seed)
+    bots["random"] = lambda boards: random_player_moves(boards, rng)
+    return bots
+
+
+def serve(bots, host="127.0.0.1", port=8765, max_batch=256, max_delay=0.002):
+    """Serve games against ``bots`` (name -> move function, see ``make_bots``) until interrupted"""
+    server = GameServer(bots, max_batch, max_delay)
+    print("[serving %s on %s:%i]" % (", ".join(server.batchers), host, port))
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    print("[%s]" % server.stats())
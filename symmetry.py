@@ -0,0 +1,109 @@
+""" symmetry.py
+~~~~~~~~~~~~~~~
+``MoveCache`` remembers the moves a network chose, keyed on the exact board
+as an 18 bit key (9 bits for the player to move and 9 bits for the
+opponent, see ``key_to_board``). ``NeuralnetPlayer`` uses it.
+
+The board looks the same after any of its 4 rotations and 4 reflections.
+``canonical_key`` maps a board to the smallest key of its 8 symmetric boards
+and ``to_canonical_move``/``from_canonical_move`` map moves between the two
+(``board_masks`` gives the bitboards of a ``Game.board`` style list).
+Nothing in the game or the training uses them, a network does not treat
+symmetric boards alike so the move cache cannot share their entries. They
+are kept for analysis, for example counting the distinct positions a
+population reaches.
+
+"""
+
+from collections import OrderedDict
+
+# square i of the transformed board is square SYMMETRIES[t][i] of the original board
+_ROTATE = (6, 3, 0, 7, 4, 1, 8, 5, 2) # a quarter turn clockwise
+_REFLECT = (2, 1, 0, 5, 4, 3, 8, 7, 6) # left to right
+
+SYMMETRIES = []
+for _reflect in (False, True):
+    _sym = tuple(_REFLECT) if _reflect else tuple(range(9))
+    for _turn in range(4):
+        SYMMETRIES.append(_sym)
+        _sym = tuple(_sym[r] for r in _ROTATE)
+
+# where each square of the original board ends up, the inverse of SYMMETRIES
+INVERSE_SYMMETRIES = [tuple(sym.index(i) for i in range(9)) for sym in SYMMETRIES]
+
+# every 9 bit mask of squares, transformed by each symmetry
+_PERMUTED_MASKS = [[sum(1 << i for i in range(9) if mask >> sym[i] & 1) for mask in range(512)]
+                   for sym in SYMMETRIES]
+
+
+def board_masks(board, letter):
+    """Return bitmasks of the squares taken by ``letter`` and by the opponent
+    on a ``Game.board`` style list"""
+    own, opponent = 0, 0
+    for i, val in enumerate(board):
+        if val == letter:
+            own |= 1 << i
+        elif val != "":
+            opponent |= 1 << i
+    return own, opponent
+
+
+def canonical_key(own, opponent):
+    """Return (key, symmetry) where key is the smallest 18 bit key of the 8
+    symmetric boards and symmetry is the index into SYMMETRIES that gives it"""
+    best_key, best_sym = None, 0
+    for t, permuted in enumerate(_PERMUTED_MASKS):
+        key = permuted[own] | permuted[opponent] << 9
+        if best_key is None or key < best_key:
+            best_key, best_sym = key, t
+    return best_key, best_sym
+
+
+def key_to_board(key):
+    """Return the board of a key as a list of 1 (player to move), -1 (opponent) and 0 (open)"""
+    return [1 if key >> i & 1 else (-1 if key >> (i + 9) & 1 else 0) for i in range(9)]
+
+
+def to_canonical_move(move, symmetry):
+    """Map a move on the real board to the canonical board"""
+    return INVERSE_SYMMETRIES[symmetry][move]
+
+
+def from_canonical_move(move, symmetry):
+    """Map a move on the canonical board back to the real board"""
+    return SYMMETRIES[symmetry][move]
+
+
+### MoveCache - remembers the moves a fixed network chose
+class MoveCache(object):
+    """Bounded least recently used cache of moves keyed by 18 bit board keys
+    (see ``key_to_board``). A network's weights have to stay the same while
+    its cache is in use."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits, self.misses = 0, 0
+        self._moves = OrderedDict()
+
+    def get(self, key):
+        """Return the cached move for ``key`` or None"""
+        move = self._moves.get(key)
+        if move is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._moves.move_to_end(key)
+        return move
+
+    def put(self, key, move):
+        self._moves[key] = move
+        self._moves.move_to_end(key)
+        if len(self._moves) > self.maxsize:
+            self._moves.popitem(last=False)
+
+    def clear(self):
+        self._moves.clear()
+        self.hits, self.misses = 0, 0
+
+    def __len__(self):
+        return len(self._moves)
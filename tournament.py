@@ -0,0 +1,115 @@
+""" tournament.py
+~~~~~~~~~~~~~~~~~
+Plays the individuals of a population against each other and keeps an Elo
+rating for each of them. A schedule decides who plays who in a round, then
+every game of the round is played at once in a ``BatchGame``, so the cost
+only depends on how many games are scheduled:
+
+    round_robin   every individual plays every other one as X and as O,
+                  n * (n - 1) games
+    swiss         individuals are sorted by rating and neighbours play
+                  each other as X and as O, n games
+    random        every individual plays ``k`` random opponents as X and
+                  as O, 2 * k * n games
+
+"""
+
+import numpy as np
+
+from batchGame import BatchGame, X, O, indexed_player_moves
+from network import stack_weights
+
+SCHEDULES = ("round_robin", "swiss", "random")
+
+
+#### Schedules, each returns arrays of who plays X and who plays O
+def round_robin_pairings(n):
+    x, o = np.nonzero(~np.eye(n, dtype=bool))
+    return x, o
+
+
+def swiss_pairings(ratings, rng):
+    # random tie breaks so equal ratings do not always meet the same neighbour
+    order = np.lexsort((rng.random(len(ratings)), -np.asarray(ratings)))
+    top, bottom = order[0:-1:2], order[1::2] # an odd one out sits this round out
+    return np.concatenate([top, bottom]), np.concatenate([bottom, top])
+
+
+def random_pairings(n, k, rng):
+    # shifting by 1 to n - 1 never picks yourself as an opponent
+    players = np.repeat(np.arange(n), k)
+    opponents = (players + rng.integers(1, n, size=len(players))) % n
+    return np.concatenate([players, opponents]), np.concatenate([opponents, players])
+
+
+### Tournament
+class Tournament(object):
+
+    def __init__(self, schedule="round_robin", rounds=1, k=4, k_factor=32.0):
+        """Games between the members of a population.
+
+        Args:
+            schedule (str): one of ``SCHEDULES``.
+            rounds (int): rounds played every time ``play`` is called.
+            k (int): opponents per individual for the random schedule.
+            k_factor (float): the Elo K-factor, the most a rating can move
+                in one game.
+        """
+        if schedule not in SCHEDULES:
+            raise ValueError("schedule must be one of %s" % (SCHEDULES,))
+        self.schedule = schedule
+        self.rounds = rounds
+        self.k = k
+        self.k_factor = k_factor
+
+    def pairings(self, individuals, rng):
+        n = len(individuals)
+        if self.schedule == "round_robin":
+            return round_robin_pairings(n)
+        elif self.schedule == "swiss":
+            return swiss_pairings([i.rating for i in individuals], rng)
+        return random_pairings(n, self.k, rng)
+
+    def play(self, individuals, rng):
+        """Play ``rounds`` rounds. Every game counts towards the wins, losses
+        and ties of both individuals and updates their ratings.
+
+        Returns:
+            int: the number of games played.
+        """
+        if len(individuals) < 2:
+            return 0
+        net = individuals[0].net
+        if any(i.net.sizes != net.sizes or i.net.activation != net.activation for i in individuals):
+            raise ValueError("every network in a tournament must have the same sizes and activation")
+
+        weights = stack_weights([i.net for i in individuals])
+        games_played = 0
+        for _ in range(self.rounds):
+            x, o = self.pairings(individuals, rng)
+            game = BatchGame(len(x))
+            game.play_games(indexed_player_moves(weights, x, net.activation),
+                            indexed_player_moves(weights, o, net.activation))
+            self.record_results(individuals, x, o, game.winners)
+            games_played += len(x)
+        return games_played
+
+    def record_results(self, individuals, x, o, winners):
+        """Add the results to each individual and move the ratings. All games of a
+        round are rated against the ratings from the start of the round."""
+        n = len(individuals)
+        x_score = np.where(winners == X, 1.0, np.where(winners == O, 0.0, 0.5))
+
+        ratings = np.array([i.rating for i in individuals], dtype=float)
+        x_expected = 1.0 / (1.0 + 10.0 ** ((ratings[o] - ratings[x]) / 400.0))
+        change = self.k_factor * (x_score - x_expected)
+        delta = np.bincount(x, change, minlength=n) - np.bincount(o, change, minlength=n)
+
+        wins = np.bincount(x, winners == X, minlength=n) + np.bincount(o, winners == O, minlength=n)
+        losses = np.bincount(x, winners == O, minlength=n) + np.bincount(o, winners == X, minlength=n)
+        ties = np.bincount(x, winners == 0, minlength=n) + np.bincount(o, winners == 0, minlength=n)
+        for index, i in enumerate(individuals):
+            i.rating += float(delta[index])
+            i.wins += int(wins[index])
+            i.losses += int(losses[index])
+            i.ties += int(ties[index])